@@ -14,12 +14,18 @@ _sym_db = _symbol_database.Default()
 
 
 
-DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\nuser.proto\x12\x04user\"\x1d\n\x0fUserInfoRequest\x12\n\n\x02id\x18\x01 \x01(\t\"T\n\rUserInfoReply\x12\n\n\x02id\x18\x01 \x01(\t\x12\x0c\n\x04name\x18\x02 \x01(\t\x12\r\n\x05\x65mail\x18\x03 \x01(\t\x12\x0b\n\x03\x61ge\x18\x04 \x01(\x05\x12\r\n\x05roles\x18\x05 \x01(\t2?\n\x04User\x12\x37\n\x07GetInfo\x12\x15.user.UserInfoRequest\x1a\x13.user.UserInfoReply\"\x00\x62\x06proto3')
+DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\nuser.proto\x12\x04user\"\x1d\n\x0fUserInfoRequest\x12\n\n\x02id\x18\x01 \x01(\t\"\x8f\x01\n\rUserInfoReply\x12\n\n\x02id\x18\x01 \x01(\t\x12\x0c\n\x04name\x18\x02 \x01(\t\x12\r\n\x05\x65mail\x18\x03 \x01(\t\x12\x0b\n\x03\x61ge\x18\x04 \x01(\x05\x12\r\n\x05roles\x18\x05 \x01(\t\x12\x12\n\nrole_names\x18\x06 \x03(\t\x12\x12\n\nupdated_at\x18\x07 \x01(\x03\x12\x11\n\tcache_ttl\x18\x08 \x01(\x05\"#\n\x14UserInfoBatchRequest\x12\x0b\n\x03ids\x18\x01 \x03(\t\"\xb5\x01\n\x12UserInfoBatchEntry\x12\n\n\x02id\x18\x01 \x01(\t\x12/\n\x06status\x18\x02 \x01(\x0e\x32\x1f.user.UserInfoBatchEntry.Status\x12!\n\x04user\x18\x03 \x01(\x0b\x32\x13.user.UserInfoReply\"?\n\x06Status\x12\x06\n\x02OK\x10\x00\x12\r\n\tNOT_FOUND\x10\x01\x12\x0e\n\nNOT_ACTIVE\x10\x02\x12\x0e\n\nINVALID_ID\x10\x03\"=\n\x12UserInfoBatchReply\x12\'\n\x05users\x18\x01 \x03(\x0b\x32\x18.user.UserInfoBatchEntry\"$\n\x11WatchUsersRequest\x12\x0f\n\x07version\x18\x01 \x01(\t\"h\n\nUserChange\x12\n\n\x02id\x18\x01 \x01(\t\x12\r\n\x05roles\x18\x02 \x03(\t\x12\x0e\n\x06\x61\x63tive\x18\x03 \x01(\x08\x12\x0f\n\x07version\x18\x04 \x01(\t\x12\x0f\n\x07\x64\x65leted\x18\x05 \x01(\x08\x12\r\n\x05reset\x18\x06 \x01(\x08\x32\xc4\x01\n\x04User\x12\x37\n\x07GetInfo\x12\x15.user.UserInfoRequest\x1a\x13.user.UserInfoReply\"\x00\x12\x46\n\x0cGetInfoBatch\x12\x1a.user.UserInfoBatchRequest\x1a\x18.user.UserInfoBatchReply\"\x00\x12;\n\nWatchUsers\x12\x17.user.WatchUsersRequest\x1a\x10.user.UserChange\"\x00\x30\x01\x62\x06proto3')
 
 
 
 _USERINFOREQUEST = DESCRIPTOR.message_types_by_name['UserInfoRequest']
 _USERINFOREPLY = DESCRIPTOR.message_types_by_name['UserInfoReply']
+_USERINFOBATCHREQUEST = DESCRIPTOR.message_types_by_name['UserInfoBatchRequest']
+_USERINFOBATCHENTRY = DESCRIPTOR.message_types_by_name['UserInfoBatchEntry']
+_USERINFOBATCHREPLY = DESCRIPTOR.message_types_by_name['UserInfoBatchReply']
+_WATCHUSERSREQUEST = DESCRIPTOR.message_types_by_name['WatchUsersRequest']
+_USERCHANGE = DESCRIPTOR.message_types_by_name['UserChange']
+_USERINFOBATCHENTRY_STATUS = _USERINFOBATCHENTRY.enum_types_by_name['Status']
 UserInfoRequest = _reflection.GeneratedProtocolMessageType('UserInfoRequest', (_message.Message,), {
   'DESCRIPTOR' : _USERINFOREQUEST,
   '__module__' : 'user_pb2'
@@ -34,14 +40,61 @@ UserInfoReply = _reflection.GeneratedProtocolMessageType('UserInfoReply', (_mess
   })
 _sym_db.RegisterMessage(UserInfoReply)
 
+UserInfoBatchRequest = _reflection.GeneratedProtocolMessageType('UserInfoBatchRequest', (_message.Message,), {
+  'DESCRIPTOR' : _USERINFOBATCHREQUEST,
+  '__module__' : 'user_pb2'
+  # @@protoc_insertion_point(class_scope:user.UserInfoBatchRequest)
+  })
+_sym_db.RegisterMessage(UserInfoBatchRequest)
+
+UserInfoBatchEntry = _reflection.GeneratedProtocolMessageType('UserInfoBatchEntry', (_message.Message,), {
+  'DESCRIPTOR' : _USERINFOBATCHENTRY,
+  '__module__' : 'user_pb2'
+  # @@protoc_insertion_point(class_scope:user.UserInfoBatchEntry)
+  })
+_sym_db.RegisterMessage(UserInfoBatchEntry)
+
+UserInfoBatchReply = _reflection.GeneratedProtocolMessageType('UserInfoBatchReply', (_message.Message,), {
+  'DESCRIPTOR' : _USERINFOBATCHREPLY,
+  '__module__' : 'user_pb2'
+  # @@protoc_insertion_point(class_scope:user.UserInfoBatchReply)
+  })
+_sym_db.RegisterMessage(UserInfoBatchReply)
+
+WatchUsersRequest = _reflection.GeneratedProtocolMessageType('WatchUsersRequest', (_message.Message,), {
+  'DESCRIPTOR' : _WATCHUSERSREQUEST,
+  '__module__' : 'user_pb2'
+  # @@protoc_insertion_point(class_scope:user.WatchUsersRequest)
+  })
+_sym_db.RegisterMessage(WatchUsersRequest)
+
+UserChange = _reflection.GeneratedProtocolMessageType('UserChange', (_message.Message,), {
+  'DESCRIPTOR' : _USERCHANGE,
+  '__module__' : 'user_pb2'
+  # @@protoc_insertion_point(class_scope:user.UserChange)
+  })
+_sym_db.RegisterMessage(UserChange)
+
 _USER = DESCRIPTOR.services_by_name['User']
 if _descriptor._USE_C_DESCRIPTORS == False:
 
   DESCRIPTOR._options = None
   _USERINFOREQUEST._serialized_start=20
   _USERINFOREQUEST._serialized_end=49
-  _USERINFOREPLY._serialized_start=51
-  _USERINFOREPLY._serialized_end=135
-  _USER._serialized_start=137
-  _USER._serialized_end=200
+  _USERINFOREPLY._serialized_start=52
+  _USERINFOREPLY._serialized_end=195
+  _USERINFOBATCHREQUEST._serialized_start=197
+  _USERINFOBATCHREQUEST._serialized_end=232
+  _USERINFOBATCHENTRY._serialized_start=235
+  _USERINFOBATCHENTRY._serialized_end=416
+  _USERINFOBATCHENTRY_STATUS._serialized_start=353
+  _USERINFOBATCHENTRY_STATUS._serialized_end=416
+  _USERINFOBATCHREPLY._serialized_start=418
+  _USERINFOBATCHREPLY._serialized_end=479
+  _WATCHUSERSREQUEST._serialized_start=481
+  _WATCHUSERSREQUEST._serialized_end=517
+  _USERCHANGE._serialized_start=519
+  _USERCHANGE._serialized_end=623
+  _USER._serialized_start=626
+  _USER._serialized_end=822
 # @@protoc_insertion_point(module_scope)
@@ -19,6 +19,16 @@ class UserStub(object):
                 request_serializer=user__pb2.UserInfoRequest.SerializeToString,
                 response_deserializer=user__pb2.UserInfoReply.FromString,
                 )
+        self.GetInfoBatch = channel.unary_unary(
+                '/user.User/GetInfoBatch',
+                request_serializer=user__pb2.UserInfoBatchRequest.SerializeToString,
+                response_deserializer=user__pb2.UserInfoBatchReply.FromString,
+                )
+        self.WatchUsers = channel.unary_stream(
+                '/user.User/WatchUsers',
+                request_serializer=user__pb2.WatchUsersRequest.SerializeToString,
+                response_deserializer=user__pb2.UserChange.FromString,
+                )
 
 
 class UserServicer(object):
@@ -30,6 +40,18 @@ class UserServicer(object):
         context.set_details('Method not implemented!')
         raise NotImplementedError('Method not implemented!')
 
+    def GetInfoBatch(self, request, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def WatchUsers(self, request, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
 
 def add_UserServicer_to_server(servicer, server):
     rpc_method_handlers = {
@@ -38,6 +60,16 @@ def add_UserServicer_to_server(servicer, server):
                     request_deserializer=user__pb2.UserInfoRequest.FromString,
                     response_serializer=user__pb2.UserInfoReply.SerializeToString,
             ),
+            'GetInfoBatch': grpc.unary_unary_rpc_method_handler(
+                    servicer.GetInfoBatch,
+                    request_deserializer=user__pb2.UserInfoBatchRequest.FromString,
+                    response_serializer=user__pb2.UserInfoBatchReply.SerializeToString,
+            ),
+            'WatchUsers': grpc.unary_stream_rpc_method_handler(
+                    servicer.WatchUsers,
+                    request_deserializer=user__pb2.WatchUsersRequest.FromString,
+                    response_serializer=user__pb2.UserChange.SerializeToString,
+            ),
     }
     generic_handler = grpc.method_handlers_generic_handler(
             'user.User', rpc_method_handlers)
@@ -64,3 +96,37 @@ class User(object):
             user__pb2.UserInfoReply.FromString,
             options, channel_credentials,
             insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
+
+    @staticmethod
+    def GetInfoBatch(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(request, target, '/user.User/GetInfoBatch',
+            user__pb2.UserInfoBatchRequest.SerializeToString,
+            user__pb2.UserInfoBatchReply.FromString,
+            options, channel_credentials,
+            insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
+
+    @staticmethod
+    def WatchUsers(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_stream(request, target, '/user.User/WatchUsers',
+            user__pb2.WatchUsersRequest.SerializeToString,
+            user__pb2.UserChange.FromString,
+            options, channel_credentials,
+            insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
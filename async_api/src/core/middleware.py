@@ -1,4 +1,6 @@
 import logging
+import time
+from collections import OrderedDict
 from http import HTTPStatus
 from typing import List, Tuple
 
@@ -104,11 +106,14 @@ class AuthBackend(AuthenticationBackend):
         get_scopes: callable,
         get_user: callable,
         algorithms: str or List[str],
-        auth_channel
+        auth_channel,
+        user_info_cache_size: int = 10000
     ):
         self.secret_key = secret_key
         self.algorithms = algorithms
         self.auth_channel = auth_channel
+        self.user_info_cache = OrderedDict()
+        self.user_info_cache_size = user_info_cache_size
 
         if get_scopes is None:
             self.get_scopes = self._get_scopes
@@ -121,7 +126,9 @@ class AuthBackend(AuthenticationBackend):
             self.get_user = get_user
 
     @staticmethod
-    def _get_scopes(roles: str) -> List[str]:
+    def _get_scopes(roles: str or List[str]) -> List[str]:
+        if not isinstance(roles, str):
+            return list(roles)
         try:
             roles = roles.split(',')
             return roles
@@ -166,13 +173,34 @@ class AuthBackend(AuthenticationBackend):
                 logging.warning('Auth service is unavailable')
                 raise AuthConnectorError
 
-        scopes = self.get_scopes(user_info.roles)
+        # Старый сервис авторизации передает роли только строкой
+        scopes = self.get_scopes(user_info.role_names or user_info.roles)
         user = self.get_user(user_info)
 
         return AuthCredentials(scopes=scopes), user
 
-    @auth_breaker
     async def get_user_info_request(self, id):
+        """Информация о пользователе из сервиса авторизации.
+
+        Ответ хранится столько секунд, сколько разрешил сервис
+        в `cache_ttl`, ошибки не кешируются.
+        """
+        now = time.monotonic()
+        cached = self.user_info_cache.get(id)
+        if cached is not None and cached[1] > now:
+            self.user_info_cache.move_to_end(id)
+            return cached[0]
+
+        response = await self._get_user_info(id)
+        if response.cache_ttl > 0:
+            self.user_info_cache[id] = (response, now + response.cache_ttl)
+            self.user_info_cache.move_to_end(id)
+            while len(self.user_info_cache) > self.user_info_cache_size:
+                self.user_info_cache.popitem(last=False)
+        return response
+
+    @auth_breaker
+    async def _get_user_info(self, id):
         stub = UserStub(self.auth_channel)
         response = await stub.GetInfo(UserInfoRequest(id=id))
         logging.info(response)
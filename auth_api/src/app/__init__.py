@@ -10,8 +10,13 @@ from flask_security import Security
 from flask_sqlalchemy import SQLAlchemy
 
 from app.core.config import DevelopmentConfig
+from app.core.email_filter import EmailFilter
+from app.core.hashing import PasswordHasher
+from app.core.journal import JournalSink
 from app.core.middleware import RateLimiter
+from app.core.permissions import PermissionRegistry
 from app.core.tracer import Tracer
+from app.core.user_cache import UserCache
 from app.db.redis import Redis
 
 limiter = Limiter(key_func=get_remote_address)
@@ -20,6 +25,11 @@ tracer = Tracer(console=False)
 db = SQLAlchemy()
 migrate = Migrate()
 cache = Redis()
+user_cache = UserCache()
+email_filter = EmailFilter()
+journal_sink = JournalSink()
+hasher = PasswordHasher()
+permissions = PermissionRegistry()
 ma = Marshmallow()
 jwt = JWTManager()
 security = Security()
@@ -35,19 +45,30 @@ def create_app(config_class=DevelopmentConfig):
     db.init_app(app)
     migrate.init_app(app, db)
     cache.init_app(app)
+    user_cache.init_app(app)
+    email_filter.init_app(app)
+    journal_sink.init_app(app)
+    hasher.init_app(app)
+    permissions.init_app(app)
     ma.init_app(app)
     jwt.init_app(app)
     swagger.init_app(app)
     babel.init_app(app)
 
+    from app.db.cache import session_scripts
+    session_scripts.init_app(app)
+
     from app.core.datastore import user_datastore
     security.init_app(app, user_datastore)
 
-    from app.core.cli import create
+    from app.core.cli import create, email, journal, password
     from app.core import core, jwt_callback
     from app.api.urls import api
 
     app.register_blueprint(create)
+    app.register_blueprint(email)
+    app.register_blueprint(journal)
+    app.register_blueprint(password)
     app.register_blueprint(core)
     app.register_blueprint(api)
 
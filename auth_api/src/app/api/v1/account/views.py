@@ -1,19 +1,21 @@
 from http import HTTPStatus
 
-from app import limiter
+from app import db, limiter, user_cache
 from app.core.errors import error_response
 from app.db.cache import delete_session, get_session
 from app.models.journal import Action, Journal
 from app.models.user import TOTPDevice, User
-from app.schemas.journal import JournalSchema, SessionSchema
+from app.schemas.journal import (JournalQuerySchema, JournalSchema,
+                                 SessionSchema, encode_cursor)
 from app.schemas.user import (ChangeEmailSchema, ChangePasswordSchema,
                               CodeSchema, ProfileSchema, RegisterSchema,
-                              UserSchema)
+                              UserSnapshotSchema)
 from flasgger import SwaggerView, swag_from
 from flask import abort, jsonify, request
 from flask_babel import _
 from flask_jwt_extended import get_jwt, get_jwt_identity, jwt_required
 from marshmallow import ValidationError
+from sqlalchemy.exc import IntegrityError
 
 
 class RegisterAPI(SwaggerView):
@@ -31,10 +33,13 @@ class RegisterAPI(SwaggerView):
             return error_response(HTTPStatus.UNPROCESSABLE_ENTITY,
                                   err.messages)
 
-        user = User(**data)
-        user = user.save()
+        user_id = User.register(data['email'], data['password'])
+        if user_id is None:
+            return error_response(
+                HTTPStatus.UNPROCESSABLE_ENTITY,
+                {'email': [_('The email address already exists.')]})
 
-        return jsonify(id=user.id), HTTPStatus.CREATED
+        return jsonify(id=user_id), HTTPStatus.CREATED
 
 
 class AccountAPI(SwaggerView):
@@ -42,9 +47,11 @@ class AccountAPI(SwaggerView):
     @swag_from('docs/profile_get.yml')
     def get(self):
         """Аккаунт пользователя"""
-        schema = UserSchema()
+        schema = UserSnapshotSchema()
         identity = get_jwt_identity()
-        user = User.query.get_or_404(identity, _('User not found'))
+        user = user_cache.get(identity)
+        if user is None:
+            abort(HTTPStatus.NOT_FOUND, description=_('User not found'))
         return jsonify(schema.dump(user)), HTTPStatus.OK
 
     @jwt_required()
@@ -87,9 +94,14 @@ class ChangeEmailAPI(SwaggerView):
             abort(HTTPStatus.NOT_FOUND, description=_('Invalid current email'))
 
         user.email = data.get('new_email')
-        event = Journal(Action.change_email, request)
-        user.events.append(event)
-        user.save()
+        user.add_event(Action.change_email, request)
+        try:
+            user.save()
+        except IntegrityError:
+            db.session.rollback()
+            return error_response(
+                HTTPStatus.UNPROCESSABLE_ENTITY,
+                {'new_email': [_('The email address already exists.')]})
 
         if data.get('logout_everywhere'):
             delete_session(get_jwt())
@@ -118,8 +130,7 @@ class ChangePasswordAPI(SwaggerView):
                   description=_('Invalid current password'))
 
         user.set_password(data.get('new_password'))
-        event = Journal(Action.change_password, request)
-        user.events.append(event)
+        user.add_event(Action.change_password, request)
         user.save()
 
         if data.get('logout_everywhere'):
@@ -134,9 +145,22 @@ class JournalAPI(SwaggerView):
     def get(self):
         """История событий (действия пользователя)"""
         schema = JournalSchema(many=True)
+
+        try:
+            query = JournalQuerySchema().load(request.args)
+        except ValidationError as err:
+            return error_response(HTTPStatus.UNPROCESSABLE_ENTITY,
+                                  err.messages)
+
+        limit = query.pop('limit')
         identity = get_jwt_identity()
-        events = Journal.get_by_user(identity)
-        return jsonify(schema.dump(events))
+        events = Journal.get_by_user(identity, limit=limit + 1, **query)
+
+        response = jsonify(schema.dump(events[:limit]))
+        if len(events) > limit:
+            response.headers['X-Next-Cursor'] = encode_cursor(
+                events[limit - 1])
+        return response
 
 
 class SessionsAPI(SwaggerView):
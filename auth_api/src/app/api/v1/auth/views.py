@@ -1,12 +1,13 @@
+import uuid
 from http import HTTPStatus
 
-from app import limiter
+from app import db, hasher, limiter, user_cache
 from app.core.errors import error_response
 from app.core.oauth import OAuthSignIn
 from app.core.utils import generate_random_string, send_fake_email
-from app.db.cache import delete_token, revoke_token
+from app.db.cache import revoke_token, rotate_token
 from app.models.journal import Action, Journal
-from app.models.user import User
+from app.models.user import User, issue_token_pair
 from app.schemas.user import CodeSchema, LoginSchema
 from flasgger import SwaggerView, swag_from
 from flask import abort, jsonify, redirect, request, url_for, current_app
@@ -30,19 +31,26 @@ class LoginAPI(SwaggerView):
             return error_response(HTTPStatus.UNPROCESSABLE_ENTITY,
                                   err.messages)
 
-        user = User.find_by_email(data.get('email'))
+        user = User.find_for_auth(email=data.get('email'))
+        if user is None:
+            # Для неизвестного email тоже проверяется хеш, чтобы время
+            # и стоимость ответа не зависели от существования пользователя
+            hasher.check_dummy(data.get('password'))
         if user is None or not user.check_password(data.get('password')):
             abort(HTTPStatus.NOT_FOUND,
                   description=_('Invalid email or password'))
 
         if user.totp and user.totp.confirmed:
+            # Хеш, пересчитанный в check_password, сохраняется до перехода
+            # ко второму фактору: дальше этот запрос сессию не сохраняет
+            db.session.commit()
             return redirect(url_for('.check', user_id=user.id))
 
-        event = Journal(Action.login, request)
-        user.events.append(event)
+        # Токены выпускаются до commit, пока роли и профиль загружены
+        token_pair = user.encode_token_pair()
+        user.add_event(Action.login, request)
         user.save()
 
-        token_pair = user.encode_token_pair()
         return jsonify(token_pair), HTTPStatus.OK
 
 
@@ -52,10 +60,8 @@ class LogoutAPI(SwaggerView):
     def delete(self):
         """Выход пользователя из аккаунта"""
         identity = get_jwt_identity()
-        user = User.find_by_id(identity)
-        event = Journal(Action.logout, request)
-        user.events.append(event)
-        user.save()
+        Journal.write(Action.logout, request, identity)
+        db.session.commit()
         revoke_token(get_jwt())
         return jsonify(msg=_('Access token revoked, session closed')), \
             HTTPStatus.OK
@@ -68,11 +74,19 @@ class TokenRefreshAPI(SwaggerView):
     @swag_from('docs/token_refresh_post.yml')
     def post(self):
         """Выдача новой пары токенов в обмен на корректный refresh токен"""
-        delete_token(get_jwt())
-
-        identity = get_jwt_identity()
-        user = User.find_by_id(identity)
-        token_pair = user.encode_token_pair()
+        refresh_token = get_jwt()
+        # Роли и признак активности берутся из снимка пользователя, а не
+        # из старого токена: отозванная роль не переживает обновление
+        user = user_cache.get(refresh_token['sub'])
+        if user is None or not user.active:
+            return error_response(HTTPStatus.FORBIDDEN,
+                                  'Token verification failed')
+
+        refresh_jti = str(uuid.uuid4())
+        token_pair = issue_token_pair(user, user.full_name, refresh_jti)
+        if not rotate_token(refresh_token, refresh_jti):
+            return error_response(HTTPStatus.FORBIDDEN,
+                                  'Token verification failed')
 
         return jsonify(token_pair), HTTPStatus.OK
 
@@ -83,8 +97,8 @@ class TokenVerifyAPI(SwaggerView):
     def post(self):
         """Проверка валидности токена"""
         identity = get_jwt_identity()
-        user = User.find_by_id(identity)
-        if not user or not user.is_active:
+        user = user_cache.get(identity)
+        if not user or not user.active:
             return error_response(HTTPStatus.UNPROCESSABLE_ENTITY,
                                   _('Token failed verification'))
         return jsonify(msg=_('The token has been verified')), HTTPStatus.OK
@@ -108,15 +122,15 @@ class CheckAPI(SwaggerView):
             return error_response(HTTPStatus.UNPROCESSABLE_ENTITY,
                                   err.messages)
 
-        user = User.query.get_or_404(user_id, _('User not found'))
+        user = User.query_for_auth().filter_by(id=user_id) \
+            .first_or_404(_('User not found'))
         if not user.totp.verify(data.get('code')):
             return error_response(HTTPStatus.UNAUTHORIZED, _('Invalid code'))
 
-        event = Journal(Action.login, request)
-        user.events.append(event)
+        token_pair = user.encode_token_pair()
+        user.add_event(Action.login, request)
         user.save()
 
-        token_pair = user.encode_token_pair()
         return jsonify(token_pair), HTTPStatus.OK
 
 
@@ -144,7 +158,7 @@ class OauthCallbackAPI(SwaggerView):
         if social_id is None:
             abort(HTTPStatus.UNAUTHORIZED, 'Authentication failed')
 
-        user = User.query.filter_by(email=email).first()
+        user = User.find_for_auth(email=email)
 
         if not user:
             superuser = current_app.config.get('DEBUG', False)
@@ -157,8 +171,7 @@ class OauthCallbackAPI(SwaggerView):
                 'first_name': first_name})
             user.save()
 
-        event = Journal(Action.login, request)
-        user.events.append(event)
-        user.save()
         token_pair = user.encode_token_pair()
+        user.add_event(Action.login, request)
+        user.save()
         return jsonify(token_pair), HTTPStatus.OK
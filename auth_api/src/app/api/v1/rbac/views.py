@@ -1,15 +1,56 @@
 from http import HTTPStatus
 
+import orjson
+from app import db
 from app.core.decorators import roles_accepted
 from app.core.errors import error_response
 from app.models.rbac import Role
 from app.models.user import User
-from app.schemas.rbac import RoleSchema, UserSchema
+from app.schemas.rbac import (RoleSchema, UserSchema, UsersQuerySchema,
+                              encode_user_cursor)
 from flasgger import SwaggerView, swag_from
-from flask import jsonify, request
+from flask import Response, jsonify, request, stream_with_context
 from flask_babel import _
 from flask_jwt_extended import jwt_required
 from marshmallow import ValidationError
+from sqlalchemy.exc import IntegrityError
+
+
+# Сколько строк читается из серверного курсора за раз при выгрузке NDJSON
+STREAM_BATCH_SIZE = 1000
+
+
+def list_users(role_id=None):
+    """Страница пользователей или выгрузка всех пользователей в NDJSON.
+
+    Страницы выбираются по ключу (id), курсор следующей страницы
+    возвращается в заголовке `X-Next-Cursor`. В режиме `format=ndjson`
+    строки читаются серверным курсором и отправляются по мере чтения.
+    """
+    try:
+        query = UsersQuerySchema().load(request.args)
+    except ValidationError as err:
+        return error_response(HTTPStatus.UNPROCESSABLE_ENTITY, err.messages)
+
+    users = User.listing(role_id=role_id, after=query.get('after'))
+
+    if query['format'] == 'ndjson':
+        schema = UserSchema()
+
+        def generate():
+            for user in users.yield_per(STREAM_BATCH_SIZE):
+                yield orjson.dumps(schema.dump(user)) + b'\n'
+
+        return Response(stream_with_context(generate()),
+                        mimetype='application/x-ndjson')
+
+    limit = query['limit']
+    page = users.limit(limit + 1).all()
+    response = jsonify(UserSchema(many=True).dump(page[:limit]))
+    if len(page) > limit:
+        response.headers['X-Next-Cursor'] = encode_user_cursor(
+            page[limit - 1])
+    return response
 
 
 class UsersAPI(SwaggerView):
@@ -18,9 +59,7 @@ class UsersAPI(SwaggerView):
     @swag_from('docs/users_get.yml')
     def get(self):
         """Список пользователей"""
-        schema = UserSchema(many=True)
-        users = User.all()
-        return jsonify(schema.dump(users)), HTTPStatus.OK
+        return list_users()
 
 
 class RolesAPI(SwaggerView):
@@ -44,7 +83,7 @@ class RolesAPI(SwaggerView):
     @swag_from('docs/roles_post.yml')
     def post(self):
         """Создать роль"""
-        schema = RoleSchema(only=('name', 'description'))
+        schema = RoleSchema(only=('name', 'description', 'permissions'))
 
         try:
             data = schema.load(request.get_json())
@@ -52,15 +91,17 @@ class RolesAPI(SwaggerView):
             return error_response(HTTPStatus.UNPROCESSABLE_ENTITY,
                                   error.messages)
 
-        role = Role(**data)
-        role.save()
+        if Role.create(**data) is None:
+            return error_response(
+                HTTPStatus.UNPROCESSABLE_ENTITY,
+                {'name': [_('The role name already exists.')]})
 
         return jsonify(msg=_('Role created')), HTTPStatus.CREATED
 
     @swag_from('docs/roles_patch.yml')
     def patch(self, role_id):
         """Изменить роль"""
-        schema = RoleSchema(only=('name', 'description'))
+        schema = RoleSchema(only=('name', 'description', 'permissions'))
 
         try:
             data = schema.load(request.get_json())
@@ -70,7 +111,13 @@ class RolesAPI(SwaggerView):
 
         role = Role.query.get_or_404(role_id, _('Role not found'))
         role.update(data)
-        role.save()
+        try:
+            role.save()
+        except IntegrityError:
+            db.session.rollback()
+            return error_response(
+                HTTPStatus.UNPROCESSABLE_ENTITY,
+                {'name': [_('The role name already exists.')]})
 
         return jsonify(msg=_('Role changed')), HTTPStatus.OK
 
@@ -89,10 +136,8 @@ class RolesUsersAPI(SwaggerView):
     @swag_from('docs/roles_users_get.yml')
     def get(self, role_id):
         """Пользователи с ролью"""
-        schema = UserSchema(many=True)
         role = Role.query.get_or_404(role_id, _('Role not found'))
-
-        return jsonify(schema.dump(role.users)), HTTPStatus.OK
+        return list_users(role_id=role.id)
 
     @swag_from('docs/roles_users_post.yml')
     def post(self, role_id):
@@ -100,11 +145,11 @@ class RolesUsersAPI(SwaggerView):
         role = Role.query.get_or_404(role_id, _('Role not found'))
         user_ids = request.get_json()['users']
 
-        users = User.query.filter(User.id.in_(user_ids)).all()
-        role.add_to_users(users)
+        affected = role.add_to_users(user_ids)
 
         return jsonify(msg=_('Role "%(name)s" added to users',
-                             name=role.name)), HTTPStatus.OK
+                             name=role.name),
+                       affected=affected), HTTPStatus.OK
 
     @swag_from('docs/roles_users_delete.yml')
     def delete(self, role_id):
@@ -112,11 +157,11 @@ class RolesUsersAPI(SwaggerView):
         role = Role.query.get_or_404(role_id, _('Role not found'))
         user_ids = request.get_json()['users']
 
-        users = User.query.filter(User.id.in_(user_ids)).all()
-        role.remove_from_users(users)
+        affected = role.remove_from_users(user_ids)
 
         return jsonify(msg=_('Role "%(name)s" removed from users',
-                             name=role.name)), HTTPStatus.OK
+                             name=role.name),
+                       affected=affected), HTTPStatus.OK
 
 
 class UsersRolesAPI(SwaggerView):
@@ -137,9 +182,10 @@ class UsersRolesAPI(SwaggerView):
         user = User.query.get_or_404(user_id, _('User not found'))
         roles = request.get_json()['roles']
 
-        user.add_roles(roles)
+        affected = user.add_roles(roles)
 
-        return jsonify(msg=_('Role added to user')), HTTPStatus.OK
+        return jsonify(msg=_('Role added to user'),
+                       affected=affected), HTTPStatus.OK
 
     @swag_from('docs/users_roles_delete.yml')
     def delete(self, user_id):
@@ -147,6 +193,7 @@ class UsersRolesAPI(SwaggerView):
         user = User.query.get_or_404(user_id, _('User not found'))
         roles = request.get_json()['roles']
 
-        user.remove_roles(roles)
+        affected = user.remove_roles(roles)
 
-        return jsonify(msg=_('Roles removed from user')), HTTPStatus.OK
+        return jsonify(msg=_('Roles removed from user'),
+                       affected=affected), HTTPStatus.OK
@@ -1,8 +1,18 @@
+from datetime import date
+
 import click
+from app import db, email_filter, hasher
+from app.models.journal import (DEVICE_TYPES, create_month_partition,
+                                drop_expired_partitions, month_start,
+                                partition_name)
 from app.models.user import User, Profile
-from flask import Blueprint
+from flask import Blueprint, current_app
+from sqlalchemy.exc import SQLAlchemyError
 
 create = Blueprint('create', __name__)
+email = Blueprint('email', __name__)
+journal = Blueprint('journal', __name__)
+password = Blueprint('password', __name__)
 
 
 @create.cli.command('superuser')
@@ -14,3 +24,66 @@ def create_superuser(email, password):
     user = user.save()
 
     print(f'Superuser <{user.email}> created successfully')
+
+
+@email.cli.command('filter')
+def email_filter_build():
+    # консольная команда для построения фильтра Блума занятых email
+    emails = db.session.query(User.email).yield_per(1000)
+    count = email_filter.build(email for email, in emails)
+    print(f'Email filter built, {count} addresses')
+
+
+@journal.cli.command('partitions')
+@click.option('--ahead', type=int, default=None,
+              help='Number of future months to create partitions for')
+@click.option('--retention', type=int, default=None,
+              help='Number of months to keep, older partitions are removed')
+@click.option('--detach-only', is_flag=True,
+              help='Detach expired partitions without dropping them')
+def journal_partitions(ahead, retention, detach_only):
+    # консольная команда для обслуживания помесячных секций журнала
+    config = current_app.config
+    if ahead is None:
+        ahead = config['JOURNAL_PARTITIONS_AHEAD']
+    if retention is None:
+        retention = config['JOURNAL_RETENTION_MONTHS']
+
+    current_month = month_start(date.today())
+    failed = []
+    # Каждая секция создается в своей транзакции: ошибка одной секции
+    # не откатывает остальные и удаление устаревших
+    for months in range(ahead + 1):
+        month = month_start(current_month, months)
+        for device_type in DEVICE_TYPES:
+            name = partition_name(device_type, month)
+            try:
+                with db.engine.begin() as connection:
+                    create_month_partition(connection, device_type, month)
+            except SQLAlchemyError as error:
+                failed.append(name)
+                print(f'Partition <{name}> is not created: {error}')
+            else:
+                print(f'Partition <{name}> is ready')
+
+    with db.engine.begin() as connection:
+        expired = drop_expired_partitions(
+            connection, month_start(current_month, -retention), detach_only)
+        for name in expired:
+            action = 'detached' if detach_only else 'dropped'
+            print(f'Partition <{name}> {action}')
+
+    if failed:
+        raise click.ClickException(
+            f'{len(failed)} partition(s) not created: {", ".join(failed)}')
+
+
+@password.cli.command('calibrate')
+@click.option('--target-ms', type=int, default=None,
+              help='Target time of one password check in milliseconds')
+@click.option('--method', default=None, help='PBKDF2 method, pbkdf2:sha256')
+def password_calibrate(target_ms, method):
+    # консольная команда для подбора стоимости хеширования паролей
+    target_ms = target_ms or current_app.config['PASSWORD_HASHER_TARGET_MS']
+    iterations = hasher.calibrate(target_ms, method)
+    print(f'PASSWORD_HASHER_ITERATIONS={iterations}')
@@ -1,18 +1,23 @@
 from functools import wraps
 from http import HTTPStatus
 
+from app import permissions
 from flask import jsonify
 from flask_babel import _
 from flask_jwt_extended import get_jwt, verify_jwt_in_request
 
 
+def get_perms():
+    verify_jwt_in_request()
+    return permissions.claims_mask(get_jwt())
+
+
 def superuser_required(fn):
+    required = permissions.require('superuser')
+
     @wraps(fn)
     def decorator(*args, **kwargs):
-        verify_jwt_in_request()
-        claims = get_jwt()
-        roles = claims.get('roles').split(',')
-        if 'superuser' in roles:
+        if get_perms() & required.mask:
             return fn(*args, **kwargs)
         else:
             return jsonify(msg=_('Superuser only!')), HTTPStatus.FORBIDDEN
@@ -21,15 +26,14 @@ def superuser_required(fn):
 
 
 def roles_required(*roles):
+    """Доступ пользователям, у которых есть все перечисленные права"""
+    required = permissions.require(*roles)
+
     def wrapper(fn):
         @wraps(fn)
         def decorator(*args, **kwargs):
-            verify_jwt_in_request()
-            claims = get_jwt()
-            user_roles = claims.get('roles').split(',') or None
-            if 'superuser' in user_roles:
-                return fn(*args, **kwargs)
-            if set(user_roles) == set(roles):
+            mask = required.mask
+            if get_perms() & mask == mask:
                 return fn(*args, **kwargs)
             else:
                 return jsonify(msg=_('Insufficient permissions')), \
@@ -40,17 +44,13 @@ def roles_required(*roles):
 
 
 def roles_accepted(*roles):
+    required = permissions.require(*roles)
+
     def wrapper(fn):
         @wraps(fn)
         def decorator(*args, **kwargs):
-            verify_jwt_in_request()
-            claims = get_jwt()
-            user_roles = claims.get('roles').split(',') or None
-            if 'superuser' in user_roles:
+            if get_perms() & required.mask:
                 return fn(*args, **kwargs)
-            for role in user_roles:
-                if role in roles:
-                    return fn(*args, **kwargs)
             return jsonify(msg=_('Insufficient permissions')), \
                 HTTPStatus.FORBIDDEN
         return decorator
@@ -0,0 +1,127 @@
+import hashlib
+from typing import Optional
+
+import flask
+
+# Биты добавляются только в уже построенные фильтры: пока фильтра нет,
+# пустой bitmap ответил бы «email свободен» для существующих адресов
+ADD_SCRIPT = """
+for _, key in ipairs(KEYS) do
+    if redis.call('EXISTS', key) == 1 then
+        for _, bit in ipairs(ARGV) do
+            redis.call('SETBIT', key, bit, 1)
+        end
+    end
+end
+return 0
+"""
+
+CONTAINS_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return 1
+end
+for _, bit in ipairs(ARGV) do
+    if redis.call('GETBIT', KEYS[1], bit) == 0 then
+        return 0
+    end
+end
+return 1
+"""
+
+
+def normalize_email(email):
+    return email.strip().lower()
+
+
+class EmailFilter(object):
+    """Фильтр Блума занятых email в Redis.
+
+    Отвечает «email точно свободен» или «возможно занят»: для нового
+    адреса проверка уникальности обходится без запроса к БД. Фильтр
+    общий для всех процессов и строится командой `flask email filter`,
+    до этого все адреса считаются возможно занятыми. Удалить
+    адрес из фильтра нельзя, поэтому освободившийся email проверяется
+    запросом к БД.
+    """
+
+    def __init__(self, app: Optional[flask.Flask] = None,
+                 config_prefix='EMAIL_FILTER'):
+        self.app = app
+        self.config_prefix = config_prefix
+        self.enabled = True
+        self.key = 'users:email_filter'
+        self.size = 1 << 24
+        self.hashes = 7
+        self.storage = None
+        self._add = None
+        self._contains = None
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app: flask.Flask):
+        self.app = app
+        config = app.config
+
+        def option(name, default):
+            return config.get('{0}_{1}'.format(self.config_prefix, name),
+                              default)
+
+        self.enabled = option('ENABLED', self.enabled)
+        self.key = option('KEY', self.key)
+        self.size = option('SIZE', self.size)
+        self.hashes = option('HASHES', self.hashes)
+        self.storage = app.extensions['redis']
+        self._add = self.storage.register_script(ADD_SCRIPT)
+        self._contains = self.storage.register_script(CONTAINS_SCRIPT)
+
+        if not hasattr(app, 'extensions'):
+            app.extensions = {}
+
+        app.extensions[self.config_prefix.lower()] = self
+
+    @property
+    def building_key(self):
+        return f'{self.key}:building'
+
+    def bits(self, email):
+        """Номера битов адреса: k хешей из двух половин одного blake2b"""
+        digest = hashlib.blake2b(normalize_email(email).encode(),
+                                 digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def might_contain(self, email):
+        """False, если адрес точно не занят"""
+        if not self.enabled:
+            return True
+        return bool(self._contains(keys=[self.key], args=self.bits(email)))
+
+    def add(self, emails):
+        if not self.enabled or not emails:
+            return
+        bits = [bit for email in emails for bit in self.bits(email)]
+        self._add(keys=[self.key, self.building_key], args=bits)
+
+    def build(self, emails, batch_size=1000):
+        """Строит фильтр заново по всем адресам и атомарно подменяет им
+        текущий. Адреса, добавленные во время построения, попадают в оба
+        фильтра. Возвращает число адресов."""
+        key = self.building_key
+        self.storage.delete(key)
+        # Память под весь bitmap выделяется сразу, ключ существует
+        self.storage.setbit(key, self.size - 1, 0)
+
+        count = 0
+        pipeline = self.storage.pipeline(transaction=False)
+        for email in emails:
+            for bit in self.bits(email):
+                pipeline.setbit(key, bit, 1)
+            count += 1
+            if count % batch_size == 0:
+                pipeline.execute()
+        pipeline.execute()
+
+        self.storage.rename(key, self.key)
+        return count
@@ -37,3 +37,11 @@ def ratelimit_handler(error):
 @core.app_errorhandler(500)
 def internal_error(error):
     return error_response(error.code, error.description)
+
+
+@core.app_errorhandler(503)
+def service_unavailable(error):
+    response = error_response(error.code, error.description)
+    if error.retry_after is not None:
+        response.headers['Retry-After'] = str(error.retry_after)
+    return response
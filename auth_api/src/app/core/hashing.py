@@ -0,0 +1,175 @@
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from typing import Optional
+
+import flask
+from flask_babel import _
+from opentelemetry import trace as ot_trace
+from werkzeug.exceptions import ServiceUnavailable
+from werkzeug.security import check_password_hash, generate_password_hash
+
+from .tracer import trace
+
+
+class PasswordHasher(object):
+    """Хеширование паролей.
+
+    По умолчанию хеш считается в потоке запроса. Если включен
+    `PASSWORD_HASHER_POOL`, вычисления выполняются в пуле процессов,
+    чтобы PBKDF2 не занимал GIL воркера. `PASSWORD_HASHER_WORKERS`
+    (по умолчанию - число ядер) и `PASSWORD_HASHER_QUEUE_SIZE` (по
+    умолчанию - вдвое больше) задаются на весь хост и делятся между
+    `PASSWORD_HASHER_APP_WORKERS` воркерами gunicorn: пул и очередь
+    создаются в каждом воркере. При переполнении очереди запрос сразу
+    получает 503.
+
+    Пул имеет смысл только с воркерами, обслуживающими несколько
+    запросов одновременно (gthread с `--threads` или gevent): синхронный
+    воркер ждет хеш так же, как и без пула.
+
+    Параметры хеша задаются политикой: `PASSWORD_HASHER_METHOD`
+    (алгоритм PBKDF2), `PASSWORD_HASHER_ITERATIONS` и
+    `PASSWORD_HASHER_SALT_LENGTH`. Хеши, созданные с другими параметрами,
+    определяет `needs_rehash`.
+    """
+
+    def __init__(self, app: Optional[flask.Flask] = None,
+                 config_prefix='PASSWORD_HASHER'):
+        self.app = app
+        self.config_prefix = config_prefix
+        self.pool = False
+        self.workers = None
+        self.queue_size = None
+        self.timeout = None
+        self.method = 'pbkdf2:sha256'
+        self.iterations = 260000
+        self.salt_length = 16
+        self._dummy_hash = None
+        self._executor = None
+        self._slots = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app: flask.Flask):
+        self.app = app
+        config = app.config
+
+        def option(name, default=None):
+            return config.get('{0}_{1}'.format(self.config_prefix, name),
+                              default)
+
+        self.pool = option('POOL', False)
+        app_workers = max(option('APP_WORKERS', 1), 1)
+        workers = option('WORKERS') or os.cpu_count() or 1
+        queue_size = option('QUEUE_SIZE') or workers * 2
+        self.workers = max(workers // app_workers, 1)
+        self.queue_size = max(queue_size // app_workers, 1)
+        self.timeout = option('TIMEOUT', 5)
+        self.method = option('METHOD', self.method)
+        self.iterations = option('ITERATIONS', self.iterations)
+        self.salt_length = option('SALT_LENGTH', self.salt_length)
+        # Фиктивный хеш считается один раз, а не в первом запросе
+        # с несуществующим пользователем
+        self._dummy_hash = generate_password_hash(
+            os.urandom(16).hex(), method=self.policy,
+            salt_length=self.salt_length)
+
+        if not hasattr(app, 'extensions'):
+            app.extensions = {}
+
+        app.extensions[self.config_prefix.lower()] = self
+
+    @property
+    def policy(self):
+        """Метод хеширования в формате werkzeug: pbkdf2:<hash>:<iterations>"""
+        return f'{self.method}:{self.iterations}'
+
+    @trace
+    def generate(self, password):
+        return self._run(generate_password_hash, password,
+                         method=self.policy, salt_length=self.salt_length)
+
+    @trace
+    def check(self, pwhash, password):
+        return self._run(check_password_hash, pwhash, password)
+
+    @trace
+    def check_dummy(self, password):
+        """Проверка пароля по заранее вычисленному фиктивному хешу.
+
+        Используется, когда пользователь не найден: ответ занимает столько
+        же времени и CPU, сколько проверка настоящего пароля.
+        """
+        self._run(check_password_hash, self._dummy_hash, password or '')
+        return False
+
+    def needs_rehash(self, pwhash):
+        """Создан ли хеш с параметрами, отличными от текущей политики"""
+        try:
+            method, salt, _ = pwhash.split('$', 2)
+        except ValueError:
+            return True
+        return method != self.policy or len(salt) != self.salt_length
+
+    def calibrate(self, target_ms, method=None, sample_iterations=100000):
+        """Подбирает число итераций, при котором проверка пароля
+        занимает около `target_ms` миллисекунд на текущем железе"""
+        method = method or self.method
+        timings = []
+        for _ in range(3):
+            started = time.perf_counter()
+            generate_password_hash('calibration',
+                                   method=f'{method}:{sample_iterations}',
+                                   salt_length=self.salt_length)
+            timings.append(time.perf_counter() - started)
+        elapsed_ms = min(timings) * 1000
+        iterations = int(sample_iterations * target_ms / elapsed_ms)
+        return max(iterations // 1000 * 1000, 1000)
+
+    def _run(self, func, *args, **kwargs):
+        span = ot_trace.get_current_span()
+        span.set_attribute('password.policy', self.policy)
+        span.set_attribute('password.pool', self.pool)
+        if not self.pool:
+            return func(*args, **kwargs)
+        return self._run_in_pool(func, *args, **kwargs)
+
+    def _run_in_pool(self, func, *args, **kwargs):
+        executor = self._get_executor()
+        slots = self._slots
+        if not slots.acquire(blocking=False):
+            raise ServiceUnavailable(
+                _('Server is busy, try again later'), retry_after=1)
+        try:
+            future = executor.submit(func, *args, **kwargs)
+        except BaseException:
+            slots.release()
+            raise
+        # Слот освобождается, когда задача завершится в пуле: после
+        # таймаута запроса она продолжает занимать процесс пула
+        future.add_done_callback(lambda _: slots.release())
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            raise ServiceUnavailable(
+                _('Server is busy, try again later'), retry_after=1)
+
+    def _get_executor(self):
+        # Пул создается в процессе воркера при первом обращении
+        if self._pid == os.getpid():
+            return self._executor
+        with self._lock:
+            if self._pid != os.getpid():
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context('spawn'))
+                self._slots = threading.BoundedSemaphore(self.queue_size)
+                self._pid = os.getpid()
+        return self._executor
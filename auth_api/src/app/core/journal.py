@@ -0,0 +1,181 @@
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+import uuid
+from datetime import datetime
+from typing import Optional
+
+import flask
+from opentelemetry import trace as ot_trace
+
+from .tracer import trace
+
+logger = logging.getLogger(__name__)
+
+
+class JournalSink(object):
+    """Запись событий журнала.
+
+    По умолчанию событие добавляется в текущую сессию БД и сохраняется
+    вместе с остальными изменениями запроса. Если `JOURNAL_SINK_ENABLED`
+    включен, события складываются в ограниченную очередь процесса, а
+    фоновый поток пишет их в `auth.journal` пачками (multi-row INSERT).
+    При переполнении очереди событие отбрасывается и учитывается
+    в счетчике `dropped`. Счетчики `stats` добавляются атрибутами
+    `journal.*` в span каждой записи пачки.
+    """
+
+    def __init__(self, app: Optional[flask.Flask] = None,
+                 config_prefix='JOURNAL_SINK'):
+        self.app = app
+        self.config_prefix = config_prefix
+        self.enabled = False
+        self.queue_size = 10000
+        self.batch_size = 500
+        self.flush_interval = 1.0
+        self.dropped = 0
+        self.written = 0
+        self.max_delay = 0.0
+        self._queue = None
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app: flask.Flask):
+        self.app = app
+        config = app.config
+
+        def option(name, default):
+            return config.get('{0}_{1}'.format(self.config_prefix, name),
+                              default)
+
+        self.enabled = option('ENABLED', False)
+        self.queue_size = option('QUEUE_SIZE', self.queue_size)
+        self.batch_size = option('BATCH_SIZE', self.batch_size)
+        self.flush_interval = option('FLUSH_INTERVAL', self.flush_interval)
+
+        if not hasattr(app, 'extensions'):
+            app.extensions = {}
+
+        app.extensions[self.config_prefix.lower()] = self
+
+    @property
+    def stats(self):
+        return {
+            'queued': self._queue.qsize() if self._queue else 0,
+            'written': self.written,
+            'dropped': self.dropped,
+            'max_delay': self.max_delay,
+        }
+
+    def write(self, event):
+        if not self.enabled:
+            from app import db
+            db.session.add(event)
+            return
+
+        self._ensure_worker()
+
+        event.id = event.id or uuid.uuid4()
+        event.created = event.created or datetime.now()
+        row = {column.name: getattr(event, column.key)
+               for column in event.__table__.columns}
+
+        try:
+            self._queue.put_nowait(row)
+        except queue.Full:
+            self.dropped += 1
+            logger.warning('Journal queue is full, event dropped '
+                           '(dropped total: %s)', self.dropped)
+
+    def _ensure_worker(self):
+        # Поток создается в процессе воркера при первой записи,
+        # после fork у каждого воркера своя очередь
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._queue = queue.Queue(maxsize=self.queue_size)
+            self._stopped.clear()
+            self._thread = threading.Thread(target=self._run,
+                                            name='journal-sink',
+                                            daemon=True)
+            self._thread.start()
+            self._pid = os.getpid()
+            atexit.register(self.shutdown)
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._flush(self._collect_batch())
+        self._flush(self._drain())
+
+    def _collect_batch(self):
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                row = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if row is None:
+                break
+            batch.append(row)
+        return batch
+
+    def _drain(self):
+        batch = []
+        while True:
+            try:
+                row = self._queue.get_nowait()
+            except queue.Empty:
+                return batch
+            if row is not None:
+                batch.append(row)
+
+    def _flush(self, rows):
+        if rows:
+            self._write(rows)
+
+    @trace
+    def _write(self, rows):
+        from app import db
+        from app.models.journal import Journal
+
+        try:
+            with self.app.app_context():
+                with db.engine.begin() as connection:
+                    connection.execute(Journal.__table__.insert(), rows)
+        except Exception:
+            self.dropped += len(rows)
+            logger.exception('Failed to write %s journal events', len(rows))
+        else:
+            self.written += len(rows)
+            delay = (datetime.now() - min(row['created'] for row in rows))
+            self.max_delay = max(self.max_delay, delay.total_seconds())
+
+        span = ot_trace.get_current_span()
+        span.set_attribute('journal.batch', len(rows))
+        for name, value in self.stats.items():
+            span.set_attribute(f'journal.{name}', value)
+
+    def shutdown(self, timeout=10):
+        """Останавливает фоновый поток, дописав события из очереди"""
+        if self._thread is None or not self._thread.is_alive():
+            return
+        self._stopped.set()
+        try:
+            self._queue.put_nowait(None)
+        except queue.Full:
+            pass
+        self._thread.join(timeout)
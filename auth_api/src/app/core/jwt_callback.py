@@ -1,7 +1,9 @@
 from http import HTTPStatus
 
-from app import cache, jwt
+from app import jwt, permissions
 from app.core.errors import error_response
+from app.core.user_cache import UserSnapshot
+from app.db.cache import get_token_state
 
 
 @jwt.user_identity_loader
@@ -11,29 +13,33 @@ def user_identity_lookup(user):
 
 @jwt.additional_claims_loader
 def additional_claims_lookup(user):
-    roles = [role.name for role in user.roles] or []
+    if isinstance(user, UserSnapshot):
+        # Обновление пары токенов по снимку пользователя из кеша
+        roles = list(user.roles)
+        granted = user.permissions
+    else:
+        roles = [role.name for role in user.roles]
+        granted = [name for role in user.roles for name in role.permissions]
     if user.is_superuser:
         roles.append('superuser')
 
     claims = {
-        'roles': ','.join(roles)
+        'roles': ','.join(roles),
+        'perms': permissions.roles_mask(roles, granted)
     }
     return claims
 
 
 @jwt.token_in_blocklist_loader
 def check_if_token_is_revoked(header, payload):
-    jti = payload['jti']
-    token_in_cache = cache.get(f'blocklist:{jti}')
-    return token_in_cache is not None
+    revoked, _ = get_token_state(payload)
+    return revoked
 
 
 @jwt.token_verification_loader
 def check_if_token_is_verification(header, payload):
-    user = payload['sub']
-    jti = payload['rti'] if payload['type'] == 'access' else payload['jti']
-    token_in_cache = cache.get(f'user:{user}:{jti}')
-    return token_in_cache is not None
+    _, active = get_token_state(payload)
+    return active
 
 
 @jwt.token_verification_failed_loader
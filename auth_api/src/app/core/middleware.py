@@ -1,9 +1,7 @@
 import re
-import time
 from typing import Optional
 
 import flask
-import orjson
 from werkzeug.exceptions import TooManyRequests
 
 LIMIT_EXPR = re.compile(
@@ -23,43 +21,62 @@ TIME_UNITS = dict(
     second=1,
 )
 
-
-class TokenBucket:
-    def __init__(self, tokens, refill_period, capacity=None, last_check=None):
-        self.tokens: int = tokens
-        self.capacity: int = capacity if capacity is not None else tokens
-        self.refill_period = refill_period
-        self.last_check = last_check or time.monotonic()
-
-    def token_count(self):
-        current_time = time.monotonic()
-        time_passed = current_time - self.last_check
-        token_delta = int(time_passed//self.refill_period)
-
-        if(token_delta + int(self.capacity) >= int(self.tokens)):
-            self.capacity = self.tokens
-            self.last_check = current_time
-        else:
-            self.capacity += token_delta
-            self.last_check = self.last_check + \
-                token_delta * float(self.refill_period)
-
-        try_again_seconds = self.refill_period - \
-            (current_time - self.last_check)
-
-        return self.capacity, try_again_seconds
-
-    def consume(self, num_tokens: int):
-        self.capacity = int(self.capacity) - num_tokens
+# Проверка и списание токена выполняются атомарно на стороне Redis.
+# Корзина хранится в hash: `tokens` - остаток токенов,
+# `ts` - время последнего пополнения (мс, по часам Redis).
+# Скрипт возвращает {1, 0} если запрос разрешен
+# и {0, retry_after_ms} если лимит исчерпан.
+TOKEN_BUCKET_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local refill_period = tonumber(ARGV[2])
+
+local time = redis.call('TIME')
+local now = tonumber(time[1]) * 1000 + math.floor(tonumber(time[2]) / 1000)
+
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(bucket[1])
+local ts = tonumber(bucket[2])
+
+if tokens == nil or ts == nil then
+    tokens = capacity
+    ts = now
+end
+
+local refill = math.floor((now - ts) / refill_period)
+if refill > 0 then
+    tokens = math.min(capacity, tokens + refill)
+    ts = ts + refill * refill_period
+end
+if tokens >= capacity then
+    ts = now
+end
+
+local allowed = 0
+local retry_after = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+    allowed = 1
+else
+    retry_after = math.ceil(refill_period - (now - ts))
+end
+
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', ts)
+redis.call('PEXPIRE', KEYS[1], math.ceil(capacity * refill_period))
+
+return {allowed, retry_after}
+"""
 
 
 class RateLimiter(object):
-    def __init__(self, app: Optional[flask.Flask] = None, limit: str = None):
+    def __init__(self, app: Optional[flask.Flask] = None, limit: str = None,
+                 key_prefix: str = 'rate_limit'):
         self.app = app
         self.limit: str = limit
+        self.key_prefix = key_prefix
         self.tokens: int = None
-        self.refill_period: int = None
+        self.refill_period: float = None
         self.storage = None
+        self._script = None
 
     def init_app(self, app: flask.Flask):
         self.app = app
@@ -72,6 +89,8 @@ class RateLimiter(object):
         else:
             raise ValueError('Limit can not be None')
 
+        self._script = self.storage.register_script(TOKEN_BUCKET_SCRIPT)
+
         if not hasattr(app, 'extensions'):
             app.extensions = {}
 
@@ -84,33 +103,29 @@ class RateLimiter(object):
         endpoint = flask.request.endpoint or ''
         method = flask.request.method
 
-        try:
-            self._get_token(remote_addr, endpoint, method)
-        except Exception as error:
-            raise error
+        allowed, try_again_seconds = self._get_token(
+            remote_addr, endpoint, method)
 
-    def _get_token(self, remote_addr, endpoint, method):
-        limit_key = self._build_limit_key(remote_addr, endpoint, method)
-        current_bucket = self.storage.get(limit_key)
-
-        if current_bucket:
-            data = orjson.loads(current_bucket)
-            token_bucket = TokenBucket(**data)
-        else:
-            token_bucket = TokenBucket(self.tokens, self.refill_period)
-
-        remaining_token, try_again_seconds = token_bucket.token_count()
-
-        if int(remaining_token) < 1:
+        if not allowed:
             raise TooManyRequests(
                 f'Rate limit exceeded, '
                 f'try again in {try_again_seconds:.3f} seconds')
 
-        token_bucket.consume(1)
-        self.storage.set(limit_key, orjson.dumps(token_bucket.__dict__))
+    def _get_token(self, remote_addr, endpoint, method):
+        """Списывает токен из корзины за один вызов Redis.
+
+        Возвращает пару (разрешен ли запрос, через сколько секунд
+        можно повторить запрос).
+        """
+        limit_key = self._build_limit_key(remote_addr, endpoint, method)
+        allowed, retry_after = self._script(
+            keys=[limit_key],
+            args=[self.tokens, self.refill_period * 1000])
+        return bool(allowed), int(retry_after) / 1000
 
     def _build_limit_key(self, remote_addr, endpoint, method):
         return ':'.join((
+            self.key_prefix,
             str(remote_addr),
             str(endpoint),
             str(method),
@@ -120,5 +135,5 @@ class RateLimiter(object):
     def _parse_limit(self, limit):
         match = LIMIT_EXPR.match(limit)
         amount, _, time_unit = match.groups()
-        self.tokens = amount
+        self.tokens = int(amount)
         self.refill_period = TIME_UNITS[time_unit] / int(amount)
@@ -0,0 +1,118 @@
+from typing import Optional
+
+import flask
+
+
+class Requirement(object):
+    """Права, которых требует декоратор доступа, и их маска"""
+
+    def __init__(self, names):
+        self.names = names
+        self.mask = None
+
+
+class PermissionRegistry(object):
+    """Права доступа в виде битовой маски.
+
+    Каждому праву из `PERMISSIONS` соответствует бит по его позиции
+    в списке. Роль дает одноименное право и права из
+    `ROLE_PERMISSIONS[<роль>]`, роль `superuser` дает все права. Маски
+    ролей собираются один раз при инициализации, маска пользователя
+    передается в claim `perms`, и проверка доступа сводится к одному AND.
+
+    Кроме того, роль дает права из своего поля `permissions` в БД: они
+    учитываются при выдаче токена, поэтому роль, созданная или
+    измененная через API, действует без перезапуска. Права, указанные
+    в декораторах доступа, проверяются при инициализации, неизвестное
+    право останавливает запуск приложения.
+    """
+
+    def __init__(self, app: Optional[flask.Flask] = None,
+                 config_prefix='PERMISSIONS'):
+        self.app = app
+        self.config_prefix = config_prefix
+        self.bits = {}
+        self.role_masks = {}
+        self.all = 0
+        self.compiled = False
+        self._requirements = []
+        self._roles_cache = {}
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app: flask.Flask):
+        self.app = app
+        config = app.config
+        self.compile(config.get(self.config_prefix, ['superuser']),
+                     config.get(f'ROLE_{self.config_prefix}', {}))
+
+        if not hasattr(app, 'extensions'):
+            app.extensions = {}
+
+        app.extensions[self.config_prefix.lower()] = self
+
+    def compile(self, permissions, role_permissions):
+        self.bits = {name: 1 << index
+                     for index, name in enumerate(permissions)}
+        self.all = (1 << len(permissions)) - 1
+
+        role_masks = {name: bit for name, bit in self.bits.items()}
+        for role, names in role_permissions.items():
+            role_masks[role] = role_masks.get(role, 0) | self.mask(*names)
+        role_masks['superuser'] = self.all
+
+        self.role_masks = role_masks
+        self._roles_cache = {}
+        self.compiled = True
+
+        for requirement in self._requirements:
+            requirement.mask = self.mask(*requirement.names)
+
+    def require(self, *names):
+        """Маска прав для декоратора доступа.
+
+        Декораторы применяются при импорте модулей, в том числе до
+        инициализации реестра: маска вычисляется сразу, если реестр уже
+        собран, иначе - в `compile`.
+        """
+        requirement = Requirement(names)
+        if self.compiled:
+            requirement.mask = self.mask(*names)
+        self._requirements.append(requirement)
+        return requirement
+
+    def mask(self, *names):
+        """Маска прав по их названиям"""
+        mask = 0
+        for name in names:
+            if name not in self.bits:
+                raise ValueError(f'Unknown permission: {name}')
+            mask |= self.bits[name]
+        return mask
+
+    def roles_mask(self, roles, granted=()):
+        """Маска прав по списку ролей и правам, которые роли дают в БД.
+
+        Роли без прав не учитываются, права, удаленные из конфига, тоже.
+        """
+        mask = 0
+        for role in roles:
+            mask |= self.role_masks.get(role, 0)
+        for name in granted:
+            mask |= self.bits.get(name, 0)
+        return mask
+
+    def claims_mask(self, claims):
+        """Маска прав из claims токена.
+
+        В токенах, выданных до появления claim `perms`, маска считается
+        по строке ролей и запоминается.
+        """
+        perms = claims.get('perms')
+        if perms is not None:
+            return perms
+        roles = claims.get('roles') or ''
+        if roles not in self._roles_cache:
+            self._roles_cache[roles] = self.roles_mask(roles.split(','))
+        return self._roles_cache[roles]
@@ -0,0 +1,341 @@
+import atexit
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import date, datetime
+from typing import Optional, Tuple
+
+import flask
+import redis
+
+logger = logging.getLogger(__name__)
+
+# Сообщение в канале инвалидации, сбрасывающее весь кеш
+INVALIDATE_ALL = '*'
+
+# Запись изменений в ленту: каждая запись хранит в поле `prev` id
+# предыдущей, поэтому после обрезки ленты по первой записи видно,
+# какая запись удалена последней. KEYS[1] - лента, ARGV[1] - MAXLEN,
+# остальные ARGV - id пользователей.
+APPEND_SCRIPT = """
+local last = redis.call('XREVRANGE', KEYS[1], '+', '-', 'COUNT', 1)
+local prev = '0-0'
+if #last > 0 then
+    prev = last[1][1]
+end
+for i = 2, #ARGV do
+    prev = redis.call('XADD', KEYS[1], 'MAXLEN', '~', ARGV[1], '*',
+                      'id', ARGV[i], 'prev', prev)
+end
+return prev
+"""
+
+
+def parse_version(version):
+    """Версия изменения - id записи Redis Stream вида `<ms>-<seq>`"""
+    try:
+        ms, seq = version.split('-')
+        return int(ms), int(seq)
+    except ValueError:
+        raise ValueError(f'Invalid version: {version}')
+
+
+@dataclass(frozen=True)
+class UserSnapshot(object):
+    """Неизменяемый снимок пользователя для проверок авторизации"""
+    id: str
+    email: str
+    active: bool
+    is_superuser: bool
+    roles: Tuple[str, ...]
+    permissions: Tuple[str, ...]
+    full_name: str
+    first_name: str
+    last_name: str
+    birth_date: Optional[date]
+    phone: str
+    age: Optional[int]
+    date_joined: datetime
+    updated_at: datetime
+
+    @classmethod
+    def from_user(cls, user):
+        profile = user.profile
+        return cls(
+            id=str(user.id),
+            email=user.email,
+            active=bool(user.active),
+            is_superuser=user.is_superuser,
+            roles=tuple(role.name for role in user.roles),
+            permissions=tuple(sorted({name for role in user.roles
+                                      for name in role.permissions})),
+            full_name=user.full_name,
+            first_name=profile.first_name,
+            last_name=profile.last_name,
+            birth_date=profile.birth_date,
+            phone=profile.phone,
+            age=user.age,
+            date_joined=user.date_joined,
+            updated_at=user.updated_at,
+        )
+
+
+class UserCache(object):
+    """Кеш снимков пользователей в памяти процесса.
+
+    Снимок загружается из БД при первом обращении и хранится не дольше
+    `USER_CACHE_TTL` секунд, в кеше не больше `USER_CACHE_SIZE` записей,
+    при переполнении вытесняются давно не использованные. После commit,
+    изменившего пользователя, его профиль или роли, id публикуется
+    в канал Redis `USER_CACHE_CHANNEL`, и каждый процесс удаляет снимок
+    у себя.
+    """
+
+    def __init__(self, app: Optional[flask.Flask] = None,
+                 config_prefix='USER_CACHE'):
+        self.app = app
+        self.config_prefix = config_prefix
+        self.enabled = True
+        self.ttl = 60
+        self.size = 10000
+        self.channel = 'user_cache:invalidate'
+        self.stream = 'users:changes'
+        self.stream_maxlen = 100000
+        self.hits = 0
+        self.misses = 0
+        self.storage = None
+        self._append = None
+        self._entries = OrderedDict()
+        self._generation = 0
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app: flask.Flask):
+        self.app = app
+        config = app.config
+
+        def option(name, default):
+            return config.get('{0}_{1}'.format(self.config_prefix, name),
+                              default)
+
+        self.enabled = option('ENABLED', self.enabled)
+        self.ttl = option('TTL', self.ttl)
+        self.size = option('SIZE', self.size)
+        self.channel = option('CHANNEL', self.channel)
+        self.stream = option('STREAM', self.stream)
+        self.stream_maxlen = option('STREAM_MAXLEN', self.stream_maxlen)
+        self.storage = app.extensions['redis']
+        self._append = self.storage.register_script(APPEND_SCRIPT)
+
+        if not hasattr(app, 'extensions'):
+            app.extensions = {}
+
+        app.extensions[self.config_prefix.lower()] = self
+
+    @property
+    def stats(self):
+        return {
+            'size': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+        }
+
+    def get(self, user_id) -> Optional[UserSnapshot]:
+        """Снимок пользователя или None, если пользователь не найден"""
+        if not self.enabled:
+            return self._load(user_id)
+
+        self._ensure_subscriber()
+
+        key = str(user_id)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+            generation = self._generation
+
+        snapshot = self._load(user_id)
+        if snapshot is None:
+            return None
+
+        with self._lock:
+            # Пока снимок загружался, пользователь мог измениться
+            if generation == self._generation:
+                self._entries[key] = (snapshot, now + self.ttl)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.size:
+                    self._entries.popitem(last=False)
+        return snapshot
+
+    def get_many(self, user_ids):
+        """Снимки пользователей по списку id: {id: снимок}.
+
+        Отсутствующие в кеше пользователи загружаются одним запросом,
+        ненайденных пользователей в результате нет.
+        """
+        keys = {str(user_id) for user_id in user_ids}
+        snapshots = {}
+        now = time.monotonic()
+
+        if self.enabled:
+            self._ensure_subscriber()
+            with self._lock:
+                for key in keys:
+                    entry = self._entries.get(key)
+                    if entry is not None and entry[1] > now:
+                        self._entries.move_to_end(key)
+                        snapshots[key] = entry[0]
+                self.hits += len(snapshots)
+                self.misses += len(keys) - len(snapshots)
+                generation = self._generation
+
+        missing = keys - snapshots.keys()
+        if not missing:
+            return snapshots
+
+        loaded = self._load_many(missing)
+        snapshots.update(loaded)
+
+        if self.enabled and loaded:
+            with self._lock:
+                if generation == self._generation:
+                    for key, snapshot in loaded.items():
+                        self._entries[key] = (snapshot, now + self.ttl)
+                        self._entries.move_to_end(key)
+                    while len(self._entries) > self.size:
+                        self._entries.popitem(last=False)
+        return snapshots
+
+    def invalidate(self, user_ids):
+        """Удаляет снимки в текущем процессе, оповещает остальные процессы
+        и записывает изменение в ленту `USER_CACHE_STREAM`"""
+        user_ids = {str(user_id) for user_id in user_ids}
+        if not user_ids:
+            return
+        self._evict(user_ids)
+        try:
+            pipeline = self.storage.pipeline(transaction=False)
+            if self.enabled:
+                for user_id in user_ids:
+                    pipeline.publish(self.channel, user_id)
+            self._append(keys=[self.stream],
+                         args=[self.stream_maxlen, *user_ids],
+                         client=pipeline)
+            pipeline.execute()
+        except redis.exceptions.RedisError:
+            logger.exception('Failed to publish user cache invalidation')
+
+    def last_version(self):
+        """Версия (id записи) последнего изменения в ленте"""
+        entries = self.storage.xrevrange(self.stream, count=1)
+        return entries[0][0].decode() if entries else '0-0'
+
+    def is_trimmed(self, version):
+        """Удалены ли из ленты записи, следующие за `version`.
+
+        Сравнивается последняя удаленная запись (`prev` первой записи
+        ленты), а не первая: если обрезана только сама запись `version`,
+        подписчик ничего не потерял.
+        """
+        entries = self.storage.xrange(self.stream, count=1)
+        if not entries:
+            return False
+        first, fields = entries[0]
+        deleted = fields.get(b'prev')
+        if deleted is None:
+            # Запись без `prev` добавлена до появления этого поля
+            return parse_version(first.decode()) > parse_version(version)
+        return parse_version(deleted.decode()) > parse_version(version)
+
+    def read_changes(self, version, count=100):
+        """Изменения после `version`: список пар (версия, id пользователя)"""
+        streams = self.storage.xread({self.stream: version}, count=count)
+        if not streams:
+            return []
+        return [(entry_id.decode(), fields[b'id'].decode())
+                for entry_id, fields in streams[0][1]]
+
+    def invalidate_all(self):
+        self.invalidate([INVALIDATE_ALL])
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._generation += 1
+
+    def _evict(self, user_ids):
+        if INVALIDATE_ALL in user_ids:
+            self.clear()
+            return
+        with self._lock:
+            for user_id in user_ids:
+                self._entries.pop(user_id, None)
+            self._generation += 1
+
+    def _load(self, user_id):
+        from app.models.user import User
+
+        user = User.find_for_auth(id=user_id)
+        if user is None:
+            return None
+        return UserSnapshot.from_user(user)
+
+    def _load_many(self, user_ids):
+        from app.models.user import User
+
+        return {str(user.id): UserSnapshot.from_user(user)
+                for user in User.find_many_for_auth(user_ids)}
+
+    def _ensure_subscriber(self):
+        # Подписка создается в процессе воркера при первом обращении,
+        # после fork у каждого воркера свой поток и свой кеш
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._entries.clear()
+            self._stopped.clear()
+            self._thread = threading.Thread(target=self._listen,
+                                            name='user-cache-invalidation',
+                                            daemon=True)
+            self._thread.start()
+            self._pid = os.getpid()
+            atexit.register(self.shutdown)
+
+    def _listen(self):
+        while not self._stopped.is_set():
+            pubsub = self.storage.pubsub(ignore_subscribe_messages=True)
+            try:
+                pubsub.subscribe(self.channel)
+                # Сообщения, опубликованные до подписки, потеряны
+                self.clear()
+                while not self._stopped.is_set():
+                    message = pubsub.get_message(timeout=1.0)
+                    if message is not None:
+                        self._evict({message['data'].decode()})
+            except redis.exceptions.RedisError:
+                logger.warning('User cache subscription lost, reconnecting')
+                self.clear()
+                self._stopped.wait(1)
+            finally:
+                pubsub.close()
+
+    def shutdown(self, timeout=5):
+        """Останавливает поток подписки"""
+        if self._thread is None or not self._thread.is_alive():
+            return
+        self._stopped.set()
+        self._thread.join(timeout)
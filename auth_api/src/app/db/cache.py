@@ -3,35 +3,136 @@ from http import HTTPStatus
 
 import orjson
 from app import cache
-from flask import abort, current_app, request
+from flask import abort, current_app, g, request
 from flask_babel import _
-from flask_jwt_extended import decode_token
 
-import redis
 
+# Запись сеанса: сначала из hash удаляются истекшие сеансы (их jti
+# и время окончания хранятся в sorted set), затем добавляется новый.
+# KEYS[1] - hash с сеансами пользователя, KEYS[2] - sorted set с временем
+# окончания сеансов, ARGV: текущее время (unix), jti, информация о сеансе
+# в JSON, время окончания сеанса (unix), время жизни ключей в секундах.
+SET_SESSION_SCRIPT = """
+local expired = redis.call('ZRANGEBYSCORE', KEYS[2], '-inf', ARGV[1])
+if #expired > 0 then
+    redis.call('HDEL', KEYS[1], unpack(expired))
+    redis.call('ZREMRANGEBYSCORE', KEYS[2], '-inf', ARGV[1])
+end
+redis.call('HSET', KEYS[1], ARGV[2], ARGV[3])
+redis.call('ZADD', KEYS[2], ARGV[4], ARGV[2])
+redis.call('EXPIRE', KEYS[1], ARGV[5])
+redis.call('EXPIRE', KEYS[2], ARGV[5])
+return 1
+"""
 
-def set_token(token):
-    payload = decode_token(token)
-    user = payload['sub']
-    jti = payload['jti']
-    session_info = {
+# Ротация сеанса при обновлении токенов: старый refresh токен удаляется,
+# новый записывается одной атомарной операцией. Если старого сеанса уже
+# нет (закрыт или обновлен параллельным запросом), новый не создается.
+# ARGV[6] - jti старого сеанса, остальное как в SET_SESSION_SCRIPT.
+ROTATE_SESSION_SCRIPT = """
+if redis.call('HDEL', KEYS[1], ARGV[6]) == 0 then
+    return 0
+end
+redis.call('ZREM', KEYS[2], ARGV[6])
+""" + SET_SESSION_SCRIPT
+
+
+class SessionScripts(object):
+    """Lua скрипты сеансов, регистрируются один раз при создании приложения"""
+
+    def __init__(self):
+        self.set_session = None
+        self.rotate_session = None
+
+    def init_app(self, app):
+        storage = app.extensions['redis']
+        self.set_session = storage.register_script(SET_SESSION_SCRIPT)
+        self.rotate_session = storage.register_script(ROTATE_SESSION_SCRIPT)
+
+
+session_scripts = SessionScripts()
+
+
+def session_key(user):
+    """Ключ hash с сеансами пользователя: поле - jti refresh токена,
+    значение - информация о сеансе в JSON."""
+    return f'sessions:{user}'
+
+
+def session_expires_key(user):
+    """Ключ sorted set с временем окончания сеансов пользователя"""
+    return f'sessions:{user}:expires'
+
+
+def get_session_info(expires):
+    now = datetime.now()
+    return {
         'ip': request.environ.get('HTTP_X_FORWARDED_FOR',
                                   request.remote_addr),
         'user_agent': request.user_agent.string,
-        'last_activity': datetime.now().isoformat()
+        'last_activity': now.isoformat(),
+        'expires': (now + expires).isoformat()
     }
-    cache.setex(
-        f'user:{user}:{jti}',
-        current_app.config['JWT_REFRESH_TOKEN_EXPIRES'],
-        orjson.dumps(session_info)
-    )
+
+
+def write_session(write, user, jti, *args):
+    expires = current_app.config['JWT_REFRESH_TOKEN_EXPIRES']
+    session_info = get_session_info(expires)
+    now = datetime.now().timestamp()
+
+    # Время жизни у всех сеансов одинаковое, поэтому ключи живут
+    # до окончания самого нового сеанса
+    return write(
+        keys=[session_key(user), session_expires_key(user)],
+        args=[now, jti, orjson.dumps(session_info),
+              now + expires.total_seconds(), int(expires.total_seconds()),
+              *args])
+
+
+def set_token(user, jti):
+    """Сохраняет сеанс refresh токена `jti` пользователя `user`"""
+    write_session(session_scripts.set_session, user, jti)
     return True
 
 
-def delete_token(token):
-    user = token['sub']
-    jti = token['jti']
-    cache.delete(f'user:{user}:{jti}')
+def rotate_token(refresh_token, jti):
+    """Заменяет сеанс refresh токена сеансом с новым `jti`.
+
+    Возвращает False, если старый сеанс уже закрыт.
+    """
+    rotated = write_session(session_scripts.rotate_session,
+                            refresh_token['sub'], jti, refresh_token['jti'])
+    g.pop('token_states', None)
+    return bool(rotated)
+
+
+def get_token_state(payload):
+    """Состояние токена: (отозван ли токен, активна ли сессия).
+
+    Обе проверки выполняются одним pipeline-запросом к Redis, результат
+    запоминается в контексте запроса, поэтому загрузчики
+    `token_in_blocklist_loader` и `token_verification_loader`
+    обращаются к Redis один раз на запрос.
+    """
+    jti = payload['jti']
+    states = g.setdefault('token_states', {})
+    if jti in states:
+        return states[jti]
+
+    user = payload['sub']
+    session_id = payload['rti'] if payload['type'] == 'access' else jti
+
+    pipeline = cache.pipeline(transaction=False)
+    pipeline.exists(f'blocklist:{jti}')
+    pipeline.hexists(session_key(user), session_id)
+    pipeline.zscore(session_expires_key(user), session_id)
+    revoked, exists, expires = pipeline.execute()
+
+    # У сеансов, созданных до появления sorted set, времени окончания нет
+    active = exists and (expires is None
+                         or expires > datetime.now().timestamp())
+    states[jti] = (bool(revoked), bool(active))
+    return states[jti]
 
 
 def revoke_token(access_token):
@@ -42,46 +143,60 @@ def revoke_token(access_token):
 
     remaining_time = exp_access_token - datetime.now().timestamp()
 
-    def revoke_pair_token(pipeline: redis.client.Pipeline) -> None:
-        pipeline.setex(f'blocklist:{jti_access_token}', int(remaining_time), 0)
-        pipeline.delete(f'user:{identity}:{jti_refresh_token}')
+    pipeline = cache.pipeline()
+    pipeline.setex(f'blocklist:{jti_access_token}', int(remaining_time), 0)
+    pipeline.hdel(session_key(identity), jti_refresh_token)
+    pipeline.zrem(session_expires_key(identity), jti_refresh_token)
+    _, session_closed, _ = pipeline.execute()
+    g.pop('token_states', None)
+
+    return {
+        'access_token': jti_access_token,
+        'session': jti_refresh_token,
+        'session_closed': bool(session_closed)
+    }
 
-    cache.transaction(revoke_pair_token)
 
-    return cache.keys()
+def get_session(identity, session_id=None):
+    key = session_key(identity)
 
+    now = datetime.now().isoformat()
 
-def get_session(identity, session_id=None):
     if session_id is not None:
-        key = f'user:{identity}:{session_id}'
-        value = cache.get(key) or None
-        if not value:
+        value = cache.hget(key, session_id) or None
+        data = orjson.loads(value) if value else {}
+        if not data or data.get('expires', now) < now:
             abort(HTTPStatus.NOT_FOUND, description=_('Session not found'))
-        data = orjson.loads(value.decode())
         data['id'] = session_id
     else:
         data = []
-        for key in cache.scan_iter(f'user:{identity}:*'):
-            id = {'id': key.decode().split(':')[2]}
-            value = orjson.loads(cache.get(key).decode())
-            data.append(id | value)
+        expired = []
+        for id, value in cache.hgetall(key).items():
+            value = orjson.loads(value)
+            if value.get('expires', now) < now:
+                expired.append(id)
+                continue
+            data.append({'id': id.decode()} | value)
+        if expired:
+            delete_sessions(identity, expired)
     return data
 
 
+def delete_sessions(user, session_ids):
+    pipeline = cache.pipeline()
+    pipeline.hdel(session_key(user), *session_ids)
+    pipeline.zrem(session_expires_key(user), *session_ids)
+    pipeline.execute()
+
+
 def delete_session(token, session_id=None):
     user = token['sub']
     rti = token['rti']
+    key = session_key(user)
 
     if session_id is not None:
-        key = f'user:{user}:{session_id}'
-        cache.delete(key)
+        delete_sessions(user, [session_id])
     else:
-        current_session = f'user:{user}:{rti}'
-        keys = f'user:{user}:*'
-
-        pipeline = cache.pipeline()
-        cursor, keys = cache.scan(match=keys, count=1000)
-        keys.remove(current_session.encode())
-        if keys:
-            cache.delete(*keys)
-        pipeline.execute()
+        sessions = [id for id in cache.hkeys(key) if id != rti.encode()]
+        if sessions:
+            delete_sessions(user, sessions)
@@ -1,11 +1,24 @@
 import backoff
+from flask import has_request_context
 
 import redis
+from redis.backoff import ExponentialBackoff
+from redis.retry import Retry
+
+# Команды, сложность которых зависит от размера всей базы Redis
+KEYSPACE_COMMANDS = frozenset((
+    'keys', 'scan', 'scan_iter', 'randomkey', 'flushdb', 'flushall'
+))
+
+
+class KeyspaceCommandError(RuntimeError):
+    pass
 
 
 class Redis(object):
     def __init__(self, app=None, config_prefix='REDIS', **kwargs):
         self._client = None
+        self._forbidden_commands = frozenset()
         self.provider_class = redis.Redis
         self.provider_kwargs = kwargs
         self.config_prefix = config_prefix
@@ -18,15 +31,50 @@ class Redis(object):
             '{0}_URL'.format(self.config_prefix), 'redis://localhost:6379/0'
         )
 
-        self.provider_kwargs.update(kwargs)
+        provider_kwargs = self._get_pool_options(app.config)
+        provider_kwargs.update(self.provider_kwargs)
+        provider_kwargs.update(kwargs)
         self._client = self.provider_class.from_url(
-            redis_url, **self.provider_kwargs
+            redis_url, **provider_kwargs
         )
 
+        if app.config.get(
+                '{0}_FORBID_KEYSPACE_COMMANDS'.format(self.config_prefix)):
+            self._forbidden_commands = KEYSPACE_COMMANDS
+
         if not hasattr(app, 'extensions'):
             app.extensions = {}
         app.extensions[self.config_prefix.lower()] = self
 
+    def _get_pool_options(self, config):
+        """Параметры пула соединений из конфига `REDIS_*`.
+
+        Проверка соединений выполняется пулом: `health_check_interval`
+        отправляет PING только перед командой на соединении, простаивавшем
+        дольше интервала, а при обрыве соединения команда повторяется
+        с экспоненциальной задержкой.
+        """
+        def option(name, default=None):
+            return config.get(
+                '{0}_{1}'.format(self.config_prefix, name), default)
+
+        options = {
+            'max_connections': option('MAX_CONNECTIONS'),
+            'socket_timeout': option('SOCKET_TIMEOUT'),
+            'socket_connect_timeout': option('SOCKET_CONNECT_TIMEOUT'),
+            'health_check_interval': option('HEALTH_CHECK_INTERVAL', 30),
+        }
+
+        retries = option('RETRY_ATTEMPTS', 3)
+        if retries:
+            options['retry'] = Retry(
+                ExponentialBackoff(cap=1, base=0.05), retries)
+            options['retry_on_error'] = [redis.exceptions.ConnectionError,
+                                         redis.exceptions.TimeoutError]
+
+        return {key: value for key, value in options.items()
+                if value is not None}
+
     @backoff.on_exception(backoff.expo,
                           redis.exceptions.RedisError,
                           max_tries=10)
@@ -34,7 +82,9 @@ class Redis(object):
         return self._client.ping()
 
     def __getattr__(self, name):
-        self.ping()
+        if name in self._forbidden_commands and has_request_context():
+            raise KeyspaceCommandError(
+                f'{name.upper()} must not be used while handling a request')
         return getattr(self._client, name)
 
     def __getitem__(self, name):
@@ -1,10 +1,12 @@
 import enum
+import re
 import uuid
-from datetime import datetime
+from datetime import date, datetime
+from functools import lru_cache
 
-from app import db
+from app import db, journal_sink
 from flask_babel import _
-from sqlalchemy import UniqueConstraint
+from sqlalchemy import text, tuple_
 from sqlalchemy.dialects.postgresql import ENUM, UUID
 from sqlalchemy.ext.hybrid import hybrid_property
 from user_agents import parse
@@ -12,16 +14,157 @@ from user_agents import parse
 from .mixins import BaseMixin
 
 
+DEVICE_TYPES = ('smart', 'mobile', 'web')
+DEVICE_TYPE_CACHE_SIZE = 4096
+
+PARTITION_NAME = re.compile(
+    r'^journal_in_(?P<device_type>\w+?)_y(?P<year>\d{4})m(?P<month>\d{2})$')
+# Секция с событиями до перехода на помесячные секции (см. миграцию
+# 713216900f15): начинается с MINVALUE, конец читается из ее границ
+LEGACY_PARTITION_NAME = re.compile(
+    r'^journal_in_(?P<device_type>\w+?)_legacy$')
+PARTITION_END = re.compile(
+    r"TO \('(?P<year>\d{4})-(?P<month>\d{2})-(?P<day>\d{2})")
+
+
+def month_start(value: date, months: int = 0) -> date:
+    """Первое число месяца, отстоящего от `value` на `months` месяцев"""
+    index = value.year * 12 + value.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(device_type: str, month: date) -> str:
+    return f'journal_in_{device_type}_y{month:%Y}m{month:%m}'
+
+
+@lru_cache(maxsize=DEVICE_TYPE_CACHE_SIZE)
+def get_device_type(user_agent: str) -> str:
+    """Тип устройства по строке User-Agent: mobile, smart или web.
+
+    Разбор User-Agent дорогой (много регулярных выражений), а различных
+    строк в трафике немного, поэтому результат кешируется. Статистика
+    попаданий доступна через `get_device_type.cache_info()`.
+    """
+    ua = parse(user_agent)
+    if ua.is_mobile or ua.is_tablet:
+        return 'mobile'
+    elif (
+        not ua.is_pc and
+        'smart' in str(ua.device.model).lower() or
+        'smart-tv' in user_agent.lower() or
+        'smarttv' in user_agent.lower()
+    ):
+        return 'smart'
+    return 'web'
+
+
 def create_partition(target, connection, **kw) -> None:
+    # Секции по типу устройства делятся на помесячные секции по `created`.
+    # Секция DEFAULT принимает события, для которых месячная секция
+    # еще не создана, при создании секции они переносятся в нее
+    # (см. `flask journal partitions`)
+    for device_type in DEVICE_TYPES:
+        connection.execute(
+            f"""CREATE TABLE IF NOT EXISTS "journal_in_{device_type}" """
+            f"""PARTITION OF "journal" FOR VALUES IN ('{device_type}') """
+            f"""PARTITION BY RANGE (created)"""
+        )
+        connection.execute(
+            f"""CREATE TABLE IF NOT EXISTS """
+            f""""journal_in_{device_type}_default" """
+            f"""PARTITION OF "journal_in_{device_type}" DEFAULT"""
+        )
+    create_month_partitions(connection, month_start(date.today()))
+
+
+def create_month_partition(connection, device_type: str, month: date) -> bool:
+    """Создает месячную секцию типа устройства.
+
+    События этого месяца, уже попавшие в секцию DEFAULT, переносятся
+    в новую секцию в той же транзакции: иначе ATTACH PARTITION
+    отклоняется. Возвращает False, если секция уже есть.
+    """
+    name = partition_name(device_type, month)
+    parent = f'journal_in_{device_type}'
+    exists = connection.execute(
+        text('SELECT to_regclass(:name) IS NOT NULL'), name=f'"{name}"'
+    ).scalar()
+    if exists:
+        return False
+
     connection.execute(
-        """CREATE TABLE IF NOT EXISTS "journal_in_smart" PARTITION OF "journal" FOR VALUES IN ('smart')"""
-    )
-    connection.execute(
-        """CREATE TABLE IF NOT EXISTS "journal_in_mobile" PARTITION OF "journal" FOR VALUES IN ('mobile')"""
+        f'CREATE TABLE "{name}" '
+        f'(LIKE "{parent}" INCLUDING DEFAULTS INCLUDING CONSTRAINTS)'
     )
+    connection.execute(text(
+        f'WITH moved AS (DELETE FROM "{parent}_default" '
+        f'WHERE created >= :start AND created < :end RETURNING *) '
+        f'INSERT INTO "{name}" SELECT * FROM moved'
+    ), start=month, end=month_start(month, 1))
     connection.execute(
-        """CREATE TABLE IF NOT EXISTS "journal_in_web" PARTITION OF "journal" FOR VALUES IN ('web')"""
+        f'ALTER TABLE "{parent}" ATTACH PARTITION "{name}" '
+        f"FOR VALUES FROM ('{month}') TO ('{month_start(month, 1)}')"
     )
+    return True
+
+
+def create_month_partitions(connection, month: date) -> list:
+    created = []
+    for device_type in DEVICE_TYPES:
+        create_month_partition(connection, device_type, month)
+        created.append(partition_name(device_type, month))
+    return created
+
+
+def get_range_partitions(connection) -> dict:
+    """Секции журнала с ограниченным концом:
+    {имя секции: (тип устройства, первый день после секции)}.
+
+    Для месячных секций конец следует из имени, для секции `legacy` он
+    берется из границ секции в каталоге.
+    """
+    rows = connection.execute(text(
+        """SELECT child.relname,
+            pg_get_expr(child.relpartbound, child.oid) FROM pg_inherits
+        JOIN pg_class parent ON pg_inherits.inhparent = parent.oid
+        JOIN pg_class child ON pg_inherits.inhrelid = child.oid
+        JOIN pg_namespace ON parent.relnamespace = pg_namespace.oid
+        WHERE pg_namespace.nspname = 'auth'
+        AND parent.relname LIKE :parent"""
+    ), parent='journal_in_%')
+    partitions = {}
+    for name, bound in rows:
+        match = PARTITION_NAME.match(name)
+        if match is not None:
+            month = date(int(match['year']), int(match['month']), 1)
+            partitions[name] = (match['device_type'], month_start(month, 1))
+            continue
+        match = LEGACY_PARTITION_NAME.match(name)
+        end = PARTITION_END.search(bound or '')
+        if match is not None and end is not None:
+            partitions[name] = (match['device_type'], date(
+                int(end['year']), int(end['month']), int(end['day'])))
+    return partitions
+
+
+def drop_expired_partitions(connection, before: date,
+                            detach_only: bool = False) -> list:
+    """Отключает (и удаляет) секции, целиком лежащие раньше `before`,
+    в том числе секцию `legacy`"""
+    expired = []
+    partitions = get_range_partitions(connection)
+    for name, (device_type, end) in sorted(partitions.items(),
+                                           key=lambda item: item[1][1]):
+        if end > before:
+            continue
+        connection.execute(
+            f'ALTER TABLE "journal_in_{device_type}" '
+            f'DETACH PARTITION "{name}"'
+        )
+        if not detach_only:
+            connection.execute(f'DROP TABLE "{name}"')
+        expired.append(name)
+    return expired
 
 
 class Action(enum.Enum):
@@ -38,7 +181,8 @@ class Action(enum.Enum):
 class Journal(db.Model, BaseMixin):
     __tablename__ = 'journal'
     __table_args__ = (
-        UniqueConstraint('id', '_device_type'),
+        db.Index('ix_auth_journal_user_id_created',
+                 'user_id', db.text('created DESC'), db.text('id DESC')),
         {
             'schema': 'auth',
             'postgresql_partition_by': 'LIST (_device_type)',
@@ -54,9 +198,11 @@ class Journal(db.Model, BaseMixin):
     ip = db.Column(db.String(20))
     user_agent = db.Column(db.Text, nullable=True, default='')
     _device_type = db.Column(db.Text, nullable=False, primary_key=True)
-    created = db.Column(db.DateTime, nullable=False, default=datetime.now)
+    created = db.Column(db.DateTime, nullable=False, primary_key=True,
+                        default=datetime.now)
 
-    def __init__(self, action, request):
+    def __init__(self, action, request, user_id=None):
+        self.user_id = user_id
         self.action = action
         self.ip = request.environ.get(
             'HTTP_X_FORWARDED_FOR', request.remote_addr)
@@ -67,9 +213,37 @@ class Journal(db.Model, BaseMixin):
         return f'<Event {self.action}::{self.user_id}>'
 
     @classmethod
-    def get_by_user(cls, user):
-        return cls.query.filter_by(user_id=user) \
-            .order_by(cls.created.desc()).all()
+    def write(cls, action, request, user_id):
+        """Записывает событие, не загружая историю пользователя.
+
+        Событие сохраняется при ближайшем commit сессии либо, если включен
+        `JOURNAL_SINK_ENABLED`, фоновой пакетной записью.
+        """
+        event = cls(action, request, user_id=user_id)
+        journal_sink.write(event)
+        return event
+
+    @classmethod
+    def get_by_user(cls, user, limit=None, after=None, since=None,
+                    until=None, action=None):
+        """События пользователя от новых к старым.
+
+        Постраничная выборка по ключу (created, id): `after` - пара
+        (created, id) последнего события предыдущей страницы.
+        """
+        query = cls.query.filter_by(user_id=user)
+        if since is not None:
+            query = query.filter(cls.created >= since)
+        if until is not None:
+            query = query.filter(cls.created < until)
+        if action is not None:
+            query = query.filter(cls.action == action)
+        if after is not None:
+            query = query.filter(tuple_(cls.created, cls.id) < tuple_(*after))
+        query = query.order_by(cls.created.desc(), cls.id.desc())
+        if limit is not None:
+            query = query.limit(limit)
+        return query.all()
 
     @hybrid_property
     def device_type(self):
@@ -77,15 +251,4 @@ class Journal(db.Model, BaseMixin):
 
     @device_type.setter
     def device_type(self, user_agent):
-        ua = parse(user_agent)
-        if ua.is_mobile or ua.is_tablet:
-            self._device_type = 'mobile'
-        elif (
-            not ua.is_pc and
-            'smart' in str(ua.device.model).lower() or
-            'smart-tv' in user_agent.lower() or
-            'smarttv' in user_agent.lower()
-        ):
-            self._device_type = 'smart'
-        else:
-            self._device_type = 'web'
+        self._device_type = get_device_type(user_agent)
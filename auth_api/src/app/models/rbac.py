@@ -2,20 +2,79 @@ import uuid
 
 from app import db
 from flask_security import RoleMixin
-from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy import any_, bindparam, cast, delete, func, select, update
+from sqlalchemy.dialects.postgresql import ARRAY, UUID, insert
 
 from .mixins import BaseMixin
 
 
+def uuid_array(name, values):
+    """Список UUID одним параметром запроса, для `column = ANY(...)`"""
+    return any_(cast(bindparam(name, [str(value) for value in values]),
+                     ARRAY(UUID(as_uuid=True))))
+
+
 class RolesUsers(db.Model, BaseMixin):
     __tablename__ = 'roles_users'
-    __table_args__ = {'schema': 'auth'}
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'role_id',
+                            name='uq_roles_users_user_id_role_id'),
+        {'schema': 'auth'}
+    )
 
     id = db.Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4,
                    unique=True, nullable=False)
     user_id = db.Column(UUID(as_uuid=True), db.ForeignKey('auth.users.id'))
     role_id = db.Column(UUID(as_uuid=True), db.ForeignKey('auth.roles.id'))
 
+    @classmethod
+    def assign(cls, user_ids, role_ids):
+        """Выдает роли пользователям одним INSERT ... ON CONFLICT DO NOTHING.
+
+        Несуществующие пользователи и роли пропускаются. Возвращает число
+        добавленных связей.
+        """
+        from .user import User
+
+        pairs = select(func.gen_random_uuid(), User.id, Role.id).where(
+            User.id == uuid_array('user_ids', user_ids),
+            Role.id == uuid_array('role_ids', role_ids))
+        statement = insert(cls.__table__) \
+            .from_select(['id', 'user_id', 'role_id'], pairs) \
+            .on_conflict_do_nothing(index_elements=['user_id', 'role_id']) \
+            .returning(cls.user_id)
+        return cls._commit_changes(statement)
+
+    @classmethod
+    def revoke(cls, user_ids, role_ids):
+        """Отбирает роли у пользователей одним DELETE.
+
+        Возвращает число удаленных связей.
+        """
+        statement = delete(cls.__table__).where(
+            cls.user_id == uuid_array('user_ids', user_ids),
+            cls.role_id == uuid_array('role_ids', role_ids),
+        ).returning(cls.user_id)
+        return cls._commit_changes(statement)
+
+    @classmethod
+    def _commit_changes(cls, statement):
+        from .user import User
+
+        rows = db.session.execute(statement).all()
+        user_ids = {row.user_id for row in rows}
+        if user_ids:
+            # Массовые запросы идут мимо ORM: отметки об изменении
+            # пользователей для кеша и `updated_at` ставятся вручную
+            db.session.execute(
+                update(User.__table__)
+                .where(User.id == uuid_array('ids', user_ids))
+                .values(updated_at=func.now()))
+            db.session.info.setdefault('changed_users', set()) \
+                .update(user_ids)
+        db.session.commit()
+        return len(rows)
+
 
 class Role(db.Model, BaseMixin, RoleMixin):
     __tablename__ = 'roles'
@@ -25,6 +84,9 @@ class Role(db.Model, BaseMixin, RoleMixin):
                    unique=True, nullable=False)
     name = db.Column(db.String(100), unique=True, nullable=False)
     description = db.Column(db.String(200), default='')
+    # Права из реестра `PERMISSIONS`, которые дает роль
+    permissions = db.Column(ARRAY(db.String(100)), nullable=False,
+                            default=list, server_default='{}')
 
     def __repr__(self):
         return f'<Role {self.name}>'
@@ -33,14 +95,23 @@ class Role(db.Model, BaseMixin, RoleMixin):
     def find_by_name(cls, name):
         return cls.query.filter_by(name=name).first()
 
-    def add_to_users(self, users):
-        for user in users:
-            if user not in self.users:
-                self.users.append(user)
-        db.session.commit()
+    @classmethod
+    def create(cls, name, description='', permissions=()):
+        """Создает роль одним INSERT ... ON CONFLICT DO NOTHING.
 
-    def remove_from_users(self, users):
-        for user in users:
-            if user in self.users:
-                self.users.remove(user)
+        Возвращает id новой роли или None, если имя занято.
+        """
+        statement = insert(cls.__table__) \
+            .values(name=name, description=description,
+                    permissions=list(permissions)) \
+            .on_conflict_do_nothing(index_elements=['name']) \
+            .returning(cls.id)
+        role_id = db.session.execute(statement).scalar()
         db.session.commit()
+        return role_id
+
+    def add_to_users(self, user_ids):
+        return RolesUsers.assign(user_ids, [self.id])
+
+    def remove_from_users(self, user_ids):
+        return RolesUsers.revoke(user_ids, [self.id])
@@ -2,18 +2,41 @@ import uuid
 from datetime import date, datetime
 
 import pyotp
-from app import db
+from app import db, email_filter, hasher, user_cache
+from app.core.user_cache import INVALIDATE_ALL
 from app.db.cache import set_token
-from flask_jwt_extended import (create_access_token, create_refresh_token,
-                                get_jti)
+from flask_jwt_extended import create_access_token, create_refresh_token
 from flask_security import UserMixin
 from sqlalchemy import event
-from sqlalchemy.dialects.postgresql import UUID
-from werkzeug.security import check_password_hash, generate_password_hash
+from sqlalchemy.dialects.postgresql import UUID, insert
+from sqlalchemy.orm import joinedload, selectinload
+from sqlalchemy.orm.attributes import get_history
 
 from .journal import Journal
 from .mixins import BaseMixin
-from .rbac import Role
+from .rbac import Role, RolesUsers
+
+
+def issue_token_pair(identity, name, refresh_jti):
+    """Подписывает пару токенов.
+
+    `identity` - пользователь или его снимок из кеша при обновлении
+    пары. jti refresh токена создается заранее, чтобы не декодировать
+    только что подписанный токен ради sub и jti.
+    """
+    refresh_token = create_refresh_token(
+        identity=identity,
+        additional_claims={'jti': refresh_jti, 'name': name}
+    )
+    access_token = create_access_token(
+        identity=identity,
+        additional_claims={'name': name, 'rti': refresh_jti}
+    )
+    token_pair = {
+        'access_token': access_token,
+        'refresh_token': refresh_token
+    }
+    return token_pair
 
 
 class User(db.Model, BaseMixin, UserMixin):
@@ -27,11 +50,14 @@ class User(db.Model, BaseMixin, UserMixin):
     is_superuser = db.Column(db.Boolean, nullable=False, default=False)
     active = db.Column(db.Boolean, default=True)
     date_joined = db.Column(db.DateTime, nullable=False, default=datetime.now)
+    # Время последнего изменения пользователя, профиля или ролей
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.now,
+                           onupdate=datetime.now)
 
     profile = db.relationship('Profile', back_populates='user', uselist=False)
     roles = db.relationship(Role, secondary='auth.roles_users',
                             backref=db.backref('users', lazy='dynamic'))
-    events = db.relationship(Journal, backref='user')
+    events = db.relationship(Journal, backref='user', lazy='dynamic')
     totp = db.relationship('TOTPDevice', back_populates='user', uselist=False)
 
     def __init__(self, **kwargs):
@@ -46,10 +72,16 @@ class User(db.Model, BaseMixin, UserMixin):
         return f'<User {self.email} {self.id} {self.password}>'
 
     def set_password(self, raw_password):
-        self.password = generate_password_hash(raw_password)
+        self.password = hasher.generate(raw_password)
 
     def check_password(self, raw_password):
-        return check_password_hash(self.password, raw_password)
+        """Проверяет пароль. Если хеш создан не по текущей политике,
+        он пересчитывается и сохраняется при ближайшем commit"""
+        if not hasher.check(self.password, raw_password):
+            return False
+        if hasher.needs_rehash(self.password):
+            self.set_password(raw_password)
+        return True
 
     def create(self, data):
         for field in ['email']:
@@ -59,20 +91,9 @@ class User(db.Model, BaseMixin, UserMixin):
             self.set_password(data['password'])
 
     def encode_token_pair(self):
-        refresh_token = create_refresh_token(identity=self)
-        set_token(refresh_token)
-        access_token = create_access_token(
-            identity=self,
-            additional_claims={
-                'name': self.full_name,
-                'rti': get_jti(refresh_token)
-            }
-        )
-        token_pair = {
-            'access_token': access_token,
-            'refresh_token': refresh_token
-        }
-        return token_pair
+        refresh_jti = str(uuid.uuid4())
+        set_token(str(self.id), refresh_jti)
+        return issue_token_pair(self, self.full_name, refresh_jti)
 
     @property
     def full_name(self):
@@ -90,24 +111,91 @@ class User(db.Model, BaseMixin, UserMixin):
             return age
         return None
 
+    def add_event(self, action, request):
+        """Добавляет событие в журнал без загрузки истории пользователя"""
+        return Journal.write(action, request, self.id)
+
     def add_roles(self, role_ids):
-        roles = Role.query.filter(Role.id.in_(role_ids)).all()
-        for role in roles:
-            if role not in self.roles:
-                self.roles.append(role)
-        db.session.commit()
+        return RolesUsers.assign([self.id], role_ids)
 
     def remove_roles(self, role_ids):
-        roles = Role.query.filter(Role.id.in_(role_ids)).all()
-        for role in roles:
-            if role in self.roles:
-                self.roles.remove(role)
+        return RolesUsers.revoke([self.id], role_ids)
+
+    @classmethod
+    def register(cls, email, password):
+        """Создает пользователя одним INSERT ... ON CONFLICT DO NOTHING.
+
+        Уникальность email проверяет индекс, а не отдельный запрос.
+        Возвращает id нового пользователя или None, если email занят.
+        """
+        statement = insert(cls.__table__) \
+            .values(email=email, password=hasher.generate(password)) \
+            .on_conflict_do_nothing(index_elements=['email']) \
+            .returning(cls.id)
+        user_id = db.session.execute(statement).scalar()
+        if user_id is None:
+            db.session.rollback()
+            return None
+        # INSERT мимо ORM: профиль и отметка для фильтра email вручную
+        db.session.add(Profile(id=user_id))
+        db.session.info.setdefault('new_emails', set()).add(email)
         db.session.commit()
+        return user_id
+
+    @classmethod
+    def email_exists(cls, email):
+        """Занят ли email. Адрес, которого точно нет в фильтре Блума,
+        проверяется без запроса к БД"""
+        if not email_filter.might_contain(email):
+            return False
+        return db.session.query(
+            cls.query.filter_by(email=email).exists()).scalar()
 
     @classmethod
     def find_by_email(cls, email):
         return cls.query.filter_by(email=email).first()
 
+    @classmethod
+    def listing(cls, role_id=None, after=None):
+        """Запрос id и email пользователей по возрастанию id.
+
+        `after` - id последнего пользователя предыдущей страницы,
+        `role_id` - только пользователи с этой ролью.
+        """
+        query = db.session.query(cls.id, cls.email)
+        if role_id is not None:
+            query = query.join(RolesUsers, RolesUsers.user_id == cls.id) \
+                .filter(RolesUsers.role_id == role_id)
+        if after is not None:
+            query = query.filter(cls.id > after)
+        return query.order_by(cls.id)
+
+    @classmethod
+    def query_for_auth(cls):
+        """Запрос пользователя вместе с профилем, TOTP и ролями.
+
+        Все, что нужно для входа и выдачи пары токенов, загружается
+        двумя запросами: пользователь с профилем и TOTP одним JOIN,
+        роли - отдельным SELECT ... IN.
+        """
+        return cls.query.options(
+            joinedload(cls.profile),
+            joinedload(cls.totp),
+            selectinload(cls.roles),
+        )
+
+    @classmethod
+    def find_for_auth(cls, **filters):
+        return cls.query_for_auth().filter_by(**filters).first()
+
+    @classmethod
+    def find_many_for_auth(cls, ids):
+        """Пользователи с профилями и ролями одним запросом"""
+        return cls.query.options(
+            joinedload(cls.profile),
+            joinedload(cls.roles),
+        ).filter(cls.id.in_(ids)).all()
+
 
 class Profile(db.Model, BaseMixin):
     __tablename__ = 'profiles'
@@ -163,3 +251,49 @@ def receive_after_insert(mapper, connection, user):
     @event.listens_for(db.session, 'after_flush', once=True)
     def receive_after_flush(session, context):
         session.add(Profile(id=user.id))
+
+
+@event.listens_for(db.session, 'before_flush')
+def touch_changed_users(session, context, instances):
+    """Обновляет `updated_at` при изменении профиля или ролей"""
+    now = datetime.now()
+    for obj in session.dirty:
+        if isinstance(obj, User) and session.is_modified(obj):
+            obj.updated_at = now
+        elif isinstance(obj, Profile) and obj.user is not None \
+                and session.is_modified(obj):
+            obj.user.updated_at = now
+
+
+@event.listens_for(db.session, 'after_flush')
+def collect_user_changes(session, context):
+    """Запоминает пользователей, снимки которых устарели после commit"""
+    changed = session.info.setdefault('changed_users', set())
+    emails = session.info.setdefault('new_emails', set())
+    for obj in session.new | session.dirty | session.deleted:
+        if isinstance(obj, (User, Profile)):
+            changed.add(obj.id)
+            if isinstance(obj, User) and obj not in session.deleted \
+                    and get_history(obj, 'email').added:
+                emails.add(obj.email)
+        elif isinstance(obj, RolesUsers):
+            changed.add(obj.user_id)
+        elif isinstance(obj, Role) and obj not in session.new:
+            # Переименованная или удаленная роль есть у многих пользователей
+            changed.add(INVALIDATE_ALL)
+
+
+@event.listens_for(db.session, 'after_commit')
+def invalidate_user_cache(session):
+    changed = session.info.pop('changed_users', None)
+    if changed:
+        user_cache.invalidate(changed)
+    emails = session.info.pop('new_emails', None)
+    if emails:
+        email_filter.add(emails)
+
+
+@event.listens_for(db.session, 'after_rollback')
+def discard_user_changes(session):
+    session.info.pop('changed_users', None)
+    session.info.pop('new_emails', None)
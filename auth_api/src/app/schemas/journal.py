@@ -1,6 +1,32 @@
+import base64
+import uuid
+from datetime import datetime
+
 from app import ma
-from app.models.journal import Journal
-from marshmallow import fields
+from app.models.journal import Action, Journal
+from flask_babel import _
+from marshmallow import ValidationError, fields, validate
+
+
+def encode_cursor(event):
+    value = f'{event.created.isoformat()}|{event.id}'
+    return base64.urlsafe_b64encode(value.encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        value = base64.urlsafe_b64decode(cursor.encode()).decode()
+        created, id = value.split('|')
+        return datetime.fromisoformat(created), uuid.UUID(id)
+    except (ValueError, UnicodeError):
+        raise ValidationError(_('Invalid cursor.'))
+
+
+def load_action(value):
+    try:
+        return Action[value]
+    except KeyError:
+        raise ValidationError(_('Invalid action.'))
 
 
 class JournalSchema(ma.SQLAlchemyAutoSchema):
@@ -16,6 +42,14 @@ class JournalSchema(ma.SQLAlchemyAutoSchema):
         return str(obj.action)
 
 
+class JournalQuerySchema(ma.Schema):
+    limit = fields.Int(load_default=50, validate=validate.Range(1, 100))
+    cursor = fields.Function(deserialize=decode_cursor, attribute='after')
+    since = fields.DateTime()
+    until = fields.DateTime()
+    action = fields.Function(deserialize=load_action)
+
+
 class SessionSchema(ma.Schema):
     class Meta:
         ordered = True
@@ -24,3 +58,4 @@ class SessionSchema(ma.Schema):
     ip = fields.Str()
     user_agent = fields.Str()
     last_activity = fields.DateTime()
+    expires = fields.DateTime()
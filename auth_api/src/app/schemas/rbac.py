@@ -1,21 +1,33 @@
+import base64
+import uuid
+
 from app import ma
 from app.models.rbac import Role
 from app.models.user import User
 from flask_babel import _
-from marshmallow import ValidationError, validates
+from marshmallow import ValidationError, fields, validate
+
+from .validators import validate_permissions
+
+
+def encode_user_cursor(user):
+    return base64.urlsafe_b64encode(str(user.id).encode()).decode()
+
+
+def decode_user_cursor(cursor):
+    try:
+        return uuid.UUID(base64.urlsafe_b64decode(cursor.encode()).decode())
+    except (ValueError, UnicodeError):
+        raise ValidationError(_('Invalid cursor.'))
 
 
 class RoleSchema(ma.SQLAlchemyAutoSchema):
     class Meta:
         model = Role
-        fields = ('id', 'name', 'description',)
+        fields = ('id', 'name', 'description', 'permissions',)
         ordered = True
 
-    @validates('name')
-    def validate_name(self, name, load_only=True):
-        role = Role.find_by_name(name)
-        if role is not None:
-            raise ValidationError(_('The role name already exists.'))
+    permissions = fields.List(fields.Str(), validate=validate_permissions)
 
 
 class UserSchema(ma.SQLAlchemyAutoSchema):
@@ -24,3 +36,11 @@ class UserSchema(ma.SQLAlchemyAutoSchema):
         fields = ('id', 'email',)
         ordered = True
         load_instance = True
+
+
+class UsersQuerySchema(ma.Schema):
+    limit = fields.Int(load_default=100, validate=validate.Range(1, 1000))
+    cursor = fields.Function(deserialize=decode_user_cursor,
+                             attribute='after')
+    format = fields.Str(load_default='json',
+                        validate=validate.OneOf(('json', 'ndjson')))
@@ -6,6 +6,14 @@ from marshmallow import fields
 from .validators import validate_email, validate_password
 
 
+def format_phone(phone, region=None):
+    """Номер телефона в формате E.164 или None для пустого номера"""
+    if phone:
+        phone_number = phonenumbers.parse(phone, region)
+        return phonenumbers.format_number(
+            phone_number, phonenumbers.PhoneNumberFormat.E164).strip()
+
+
 class UserSchema(ma.SQLAlchemyAutoSchema):
     class Meta:
         model = User
@@ -31,16 +39,29 @@ class UserSchema(ma.SQLAlchemyAutoSchema):
             return birth_date
 
     def get_phone(self, obj):
-        if obj.profile.phone:
-            phone_number = phonenumbers.parse(obj.profile.phone, None)
-            phone = phonenumbers.format_number(
-                phone_number, phonenumbers.PhoneNumberFormat.E164)
-            return phone.strip()
+        return format_phone(obj.profile.phone)
 
     def get_roles(self, obj):
         return [role.name for role in obj.roles]
 
 
+class UserSnapshotSchema(ma.Schema):
+    """Аккаунт пользователя из кеша, в том же виде, что и UserSchema"""
+    class Meta:
+        fields = ('id', 'email', 'full_name', 'birth_date',
+                  'phone', 'roles', 'date_joined',)
+        ordered = True
+
+    id = fields.UUID()
+    date_joined = fields.DateTime()
+    birth_date = fields.Date(format='%d.%m.%Y')
+    phone = fields.Method('get_phone')
+    roles = fields.List(fields.String())
+
+    def get_phone(self, obj):
+        return format_phone(obj.phone)
+
+
 class ProfileSchema(ma.Schema):
     class Meta:
         model = Profile
@@ -53,11 +74,7 @@ class ProfileSchema(ma.Schema):
         return obj.income - obj.debt
 
     def load_phone(self, value):
-        if value:
-            phone_number = phonenumbers.parse(value, 'RU')
-            phone = phonenumbers.format_number(
-                phone_number, phonenumbers.PhoneNumberFormat.E164)
-            return phone.strip()
+        return format_phone(value, 'RU')
 
 
 class LoginSchema(ma.Schema):
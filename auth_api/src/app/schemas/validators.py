@@ -1,5 +1,6 @@
 import re
 
+from app import permissions
 from app.models.rbac import Role
 from app.models.user import User
 from flask_babel import _
@@ -7,8 +8,7 @@ from marshmallow import ValidationError
 
 
 def validate_email(email):
-    user = User.find_by_email(email)
-    if user is not None:
+    if User.email_exists(email):
         raise ValidationError(_('The email address already exists.'))
 
 
@@ -18,6 +18,13 @@ def validate_role_name(name):
         raise ValidationError(_('The role name already exists.'))
 
 
+def validate_permissions(names):
+    unknown = [name for name in names if name not in permissions.bits]
+    if unknown:
+        raise ValidationError(
+            _('Unknown permissions: %(names)s', names=', '.join(unknown)))
+
+
 def validate_password(value):
     if len(value) < 8:
         raise ValidationError(_('Make sure your password is at lest 8 letters.'))
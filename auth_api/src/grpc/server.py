@@ -3,20 +3,45 @@ import sys
 
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
 
+import argparse
+import asyncio
+import multiprocessing
+import signal
 from concurrent import futures
 
 import grpc
 import messages.user_pb2_grpc as user_service
-from services.user import UserService
+from services.user import AsyncUserService, UserService
 from app import create_app
 
 
-def grpc_server():
-    app = create_app()
+def server_options(config):
+    """Параметры gRPC сервера из конфига `GRPC_*`.
+
+    Несколько процессов (`GRPC_PROCESSES`) слушают один порт благодаря
+    SO_REUSEPORT, который grpc включает по умолчанию.
+    """
+    return [
+        ('grpc.max_concurrent_streams',
+         config.get('GRPC_MAX_CONCURRENT_STREAMS', 100)),
+        ('grpc.max_receive_message_length',
+         config.get('GRPC_MAX_RECEIVE_MESSAGE_LENGTH', 4 * 1024 * 1024)),
+        ('grpc.max_send_message_length',
+         config.get('GRPC_MAX_SEND_MESSAGE_LENGTH', 4 * 1024 * 1024)),
+    ]
+
+
+def grpc_server(app):
     config = app.config
     port = config.get('GRPC_PORT', 50051)
+    workers = config.get('GRPC_WORKERS', 10)
+    # Подписчики WatchUsers получают свои потоки и не отнимают их
+    # у унарных вызовов
+    watchers = config.get('GRPC_WATCH_MAX_STREAMS', 4)
 
-    server = grpc.server(futures.ThreadPoolExecutor(max_workers=10))
+    server = grpc.server(
+        futures.ThreadPoolExecutor(max_workers=workers + watchers),
+        options=server_options(config))
 
     user_serve = UserService(app)
     user_service.add_UserServicer_to_server(user_serve, server)
@@ -26,5 +51,69 @@ def grpc_server():
     server.wait_for_termination()
 
 
+async def grpc_aio_server(app):
+    """Сервер на grpc.aio: соединения и потоки обслуживает event loop,
+    блокирующие запросы к БД выполняются в пуле `GRPC_WORKERS` потоков"""
+    config = app.config
+    port = config.get('GRPC_PORT', 50051)
+    workers = config.get('GRPC_WORKERS', 10)
+
+    server = grpc.aio.server(options=server_options(config))
+
+    executor = futures.ThreadPoolExecutor(max_workers=workers)
+    user_serve = AsyncUserService(app, executor)
+    user_service.add_UserServicer_to_server(user_serve, server)
+
+    server.add_insecure_port(f'[::]:{port}')
+    await server.start()
+    try:
+        await server.wait_for_termination()
+    finally:
+        executor.shutdown(wait=False)
+
+
+def run(app, mode):
+    if mode == 'aio':
+        asyncio.run(grpc_aio_server(app))
+    else:
+        grpc_server(app)
+
+
+def serve(mode):
+    # Приложение создается в каждом процессе отдельно
+    run(create_app(), mode)
+
+
+def main():
+    app = create_app()
+    config = app.config
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--mode', choices=('thread', 'aio'),
+                        default=config.get('GRPC_SERVER_MODE', 'thread'))
+    parser.add_argument('--processes', type=int,
+                        default=config.get('GRPC_PROCESSES', 1))
+    args = parser.parse_args()
+
+    if args.processes <= 1:
+        run(app, args.mode)
+        return
+
+    context = multiprocessing.get_context('spawn')
+    processes = [context.Process(target=serve, args=(args.mode,))
+                 for _ in range(args.processes)]
+    for process in processes:
+        process.start()
+
+    # При остановке лаунчера останавливаются и все процессы сервера
+    signal.signal(signal.SIGTERM, lambda *args: sys.exit(0))
+    try:
+        for process in processes:
+            process.join()
+    finally:
+        for process in processes:
+            process.terminate()
+
+
 if __name__ == '__main__':
-    grpc_server()
+    main()
@@ -1,40 +1,242 @@
+import asyncio
+import threading
+import time
+import uuid
+
 import grpc
 import messages.user_pb2 as user_messages
 import messages.user_pb2_grpc as user_service
+from app import user_cache
+from app.core.user_cache import INVALIDATE_ALL, UserSnapshot, parse_version
 from app.models.user import User
 
+Status = user_messages.UserInfoBatchEntry.Status
+
+
+def user_roles(user):
+    roles = list(user.roles)
+    if user.is_superuser:
+        roles.append('superuser')
+    return roles
+
+
+def user_info(user, cache_ttl=0):
+    roles = user_roles(user)
+    return user_messages.UserInfoReply(
+        id=user.id,
+        name=user.full_name,
+        email=user.email,
+        age=user.age,
+        roles=','.join(roles),
+        role_names=roles,
+        updated_at=int(user.updated_at.timestamp() * 1000),
+        cache_ttl=cache_ttl
+    )
+
+
+def respond(context, reply, code=None, details=None):
+    if code is not None:
+        context.set_details(details)
+        context.set_code(code)
+    return reply
+
 
 class UserService(user_service.UserServicer):
     def __init__(self, app):
         self.app = app
+        self.batch_max_size = app.config.get('GRPC_BATCH_MAX_SIZE', 1000)
+        self.watch_poll_interval = app.config.get(
+            'GRPC_WATCH_POLL_INTERVAL', 0.5)
+        self.reply_cache_ttl = app.config.get('GRPC_REPLY_CACHE_TTL', 0)
+        self.watch_max_streams = app.config.get('GRPC_WATCH_MAX_STREAMS', 4)
+        self.watch_slots = threading.BoundedSemaphore(self.watch_max_streams)
 
     def GetInfo(self, request, context):
+        return respond(context, *self.get_info(request))
+
+    def GetInfoBatch(self, request, context):
+        return respond(context, *self.get_info_batch(request))
+
+    def get_info(self, request):
+        """Ответ GetInfo, код ошибки и ее описание.
+
+        Не обращается к `context`, поэтому выполняется и в пуле потоков
+        grpc.aio сервера, где контекст доступен только из event loop.
+        """
         if request.id:
             with self.app.app_context():
-                user = User().find_by_id(request.id)
+                user = user_cache.get(request.id)
                 if user:
                     if not user.active:
-                        msg = 'User not active'
-                        context.set_details(msg)
-                        context.set_code(grpc.StatusCode.UNAUTHENTICATED)
-                        return user_messages.UserInfoReply()
-
-                    roles = [role.name for role in user.roles] or []
-                    if user.is_superuser:
-                        roles.append('superuser')
-                    roles = ','.join(roles)
-                    return user_messages.UserInfoReply(
-                        id=str(user.id),
-                        name=user.full_name,
-                        email=user.email,
-                        age=user.age,
-                        roles=roles
-                    )
-                msg = 'User not found'
-                context.set_details(msg)
-                context.set_code(grpc.StatusCode.NOT_FOUND)
-                return user_messages.UserInfoReply()
-        msg = 'Must pass UUID'
-        context.set_details(msg)
-        context.set_code(grpc.StatusCode.INVALID_ARGUMENT)
-        return user_messages.UserInfoReply()
+                        return (user_messages.UserInfoReply(),
+                                grpc.StatusCode.UNAUTHENTICATED,
+                                'User not active')
+
+                    return user_info(user, self.reply_cache_ttl), None, None
+                return (user_messages.UserInfoReply(),
+                        grpc.StatusCode.NOT_FOUND, 'User not found')
+        return (user_messages.UserInfoReply(),
+                grpc.StatusCode.INVALID_ARGUMENT, 'Must pass UUID')
+
+    def get_info_batch(self, request):
+        """Информация о нескольких пользователях за один вызов.
+
+        Ответ содержит запись на каждый переданный id в том же порядке,
+        пользователи, которых нет в кеше, загружаются одним запросом.
+        """
+        if len(request.ids) > self.batch_max_size:
+            msg = f'Batch size must not exceed {self.batch_max_size}'
+            return (user_messages.UserInfoBatchReply(),
+                    grpc.StatusCode.INVALID_ARGUMENT, msg)
+
+        ids = {}
+        for id in request.ids:
+            try:
+                ids[id] = str(uuid.UUID(id))
+            except ValueError:
+                ids[id] = None
+
+        with self.app.app_context():
+            users = user_cache.get_many(
+                {id for id in ids.values() if id is not None})
+
+        entries = []
+        for id in request.ids:
+            user = users.get(ids[id])
+            if ids[id] is None:
+                entry = user_messages.UserInfoBatchEntry(
+                    id=id, status=Status.INVALID_ID)
+            elif user is None:
+                entry = user_messages.UserInfoBatchEntry(
+                    id=id, status=Status.NOT_FOUND)
+            elif not user.active:
+                entry = user_messages.UserInfoBatchEntry(
+                    id=id, status=Status.NOT_ACTIVE)
+            else:
+                entry = user_messages.UserInfoBatchEntry(
+                    id=id, status=Status.OK,
+                    user=user_info(user, self.reply_cache_ttl))
+            entries.append(entry)
+        return user_messages.UserInfoBatchReply(users=entries), None, None
+
+    def WatchUsers(self, request, context):
+        """Лента изменений пользователей.
+
+        Сначала отдаются изменения после `request.version`, затем новые
+        по мере появления. В режиме thread подписчик занимает поток на все
+        время подписки, поэтому подписчиков не больше
+        `GRPC_WATCH_MAX_STREAMS`, и их потоки не входят в `GRPC_WORKERS`.
+        """
+        if not self.watch_slots.acquire(blocking=False):
+            msg = 'Too many watchers, use GRPC_SERVER_MODE=aio'
+            context.set_details(msg)
+            context.set_code(grpc.StatusCode.RESOURCE_EXHAUSTED)
+            return
+        try:
+            yield from self._watch(request, context)
+        finally:
+            self.watch_slots.release()
+
+    def _watch(self, request, context):
+        try:
+            version, reset = self.watch_start(request.version)
+        except ValueError as error:
+            context.set_details(str(error))
+            context.set_code(grpc.StatusCode.INVALID_ARGUMENT)
+            return
+
+        if reset:
+            yield user_messages.UserChange(version=version, reset=True)
+        while context.is_active():
+            changes, version = self.watch_read(version)
+            yield from changes
+            if not changes:
+                time.sleep(self.watch_poll_interval)
+
+    def watch_start(self, version):
+        """Курсор ленты и признак того, что часть изменений потеряна"""
+        with self.app.app_context():
+            if not version:
+                return user_cache.last_version(), False
+            parse_version(version)
+            return version, user_cache.is_trimmed(version)
+
+    def watch_read(self, version):
+        """Изменения после `version` и новый курсор.
+
+        Состояние пользователей читается из БД, а не из кеша: снимок
+        в кеше процесса может еще не быть сброшен.
+        """
+        with self.app.app_context():
+            entries = user_cache.read_changes(version)
+            if not entries:
+                return [], version
+
+            ids = {user_id for _, user_id in entries
+                   if user_id != INVALIDATE_ALL}
+            users = {}
+            if ids:
+                users = {str(user.id): UserSnapshot.from_user(user)
+                         for user in User.find_many_for_auth(ids)}
+
+        changes = []
+        for entry_version, user_id in entries:
+            user = users.get(user_id)
+            if user_id == INVALIDATE_ALL:
+                change = user_messages.UserChange(
+                    version=entry_version, reset=True)
+            elif user is None:
+                change = user_messages.UserChange(
+                    id=user_id, version=entry_version, deleted=True)
+            else:
+                change = user_messages.UserChange(
+                    id=user_id, roles=user_roles(user), active=user.active,
+                    version=entry_version)
+            changes.append(change)
+        return changes, entries[-1][0]
+
+
+class AsyncUserService(user_service.UserServicer):
+    """Обработчики для grpc.aio сервера.
+
+    SQLAlchemy и кеш пользователей синхронные, поэтому запрос выполняется
+    методами `UserService` в пуле потоков, а event loop продолжает
+    принимать соединения и потоки. Контекст вызова grpc.aio не
+    потокобезопасен: код и описание ошибки выставляются в корутине.
+    """
+
+    def __init__(self, app, executor):
+        self.service = UserService(app)
+        self.executor = executor
+
+    async def _run(self, handler, request, context):
+        loop = asyncio.get_running_loop()
+        result = await loop.run_in_executor(self.executor, handler, request)
+        return respond(context, *result)
+
+    async def GetInfo(self, request, context):
+        return await self._run(self.service.get_info, request, context)
+
+    async def GetInfoBatch(self, request, context):
+        return await self._run(self.service.get_info_batch, request, context)
+
+    async def WatchUsers(self, request, context):
+        loop = asyncio.get_running_loop()
+        try:
+            version, reset = await loop.run_in_executor(
+                self.executor, self.service.watch_start, request.version)
+        except ValueError as error:
+            context.set_details(str(error))
+            context.set_code(grpc.StatusCode.INVALID_ARGUMENT)
+            return
+
+        if reset:
+            yield user_messages.UserChange(version=version, reset=True)
+        # Поток пула занят только на время чтения пачки изменений
+        while True:
+            changes, version = await loop.run_in_executor(
+                self.executor, self.service.watch_read, version)
+            for change in changes:
+                yield change
+            if not changes:
+                await asyncio.sleep(self.service.watch_poll_interval)
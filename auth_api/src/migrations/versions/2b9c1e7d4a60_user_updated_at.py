@@ -0,0 +1,27 @@
+"""user_updated_at
+
+Revision ID: 2b9c1e7d4a60
+Revises: 713216900f15
+Create Date: 2026-10-18 18:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '2b9c1e7d4a60'
+down_revision = '713216900f15'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('users',
+                  sa.Column('updated_at', sa.DateTime(), nullable=False,
+                            server_default=sa.func.now()),
+                  schema='auth')
+
+
+def downgrade():
+    op.drop_column('users', 'updated_at', schema='auth')
@@ -0,0 +1,28 @@
+"""journal_user_created_index
+
+Revision ID: 45e31f7fff8b
+Revises: 85640f5bdf20
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '45e31f7fff8b'
+down_revision = '85640f5bdf20'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Индекс на секционированной таблице создается во всех секциях
+    op.create_index('ix_auth_journal_user_id_created', 'journal',
+                    ['user_id', sa.text('created DESC'), sa.text('id DESC')],
+                    unique=False, schema='auth')
+
+
+def downgrade():
+    op.drop_index('ix_auth_journal_user_id_created', table_name='journal',
+                  schema='auth')
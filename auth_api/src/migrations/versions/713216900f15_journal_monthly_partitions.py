@@ -0,0 +1,86 @@
+"""journal_monthly_partitions
+
+Revision ID: 713216900f15
+Revises: 45e31f7fff8b
+Create Date: 2026-10-18 14:00:00.000000
+
+"""
+from datetime import date
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '713216900f15'
+down_revision = '45e31f7fff8b'
+branch_labels = None
+depends_on = None
+
+DEVICE_TYPES = ('smart', 'mobile', 'web')
+
+
+def month_start(value, months=0):
+    index = value.year * 12 + value.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def upgrade():
+    # Уникальные ограничения секционированной таблицы должны включать
+    # все ключи секционирования, в том числе `created`
+    op.execute("""
+        ALTER TABLE journal DROP CONSTRAINT IF EXISTS journal_id__device_type_key;
+        ALTER TABLE journal DROP CONSTRAINT journal_pkey;
+        ALTER TABLE journal ADD PRIMARY KEY (id, _device_type, created);
+    """)
+
+    current_month = month_start(date.today())
+    next_month = month_start(current_month, 1)
+
+    for device_type in DEVICE_TYPES:
+        # Существующая секция становится секцией `legacy` со всеми
+        # событиями до конца текущего месяца: в ней уже есть события этого
+        # месяца, и ATTACH PARTITION проверяет границы по каждой строке.
+        # Имя не месячное: секция длиннее месяца, и `flask journal
+        # partitions` удаляет ее по верхней границе
+        legacy = f'journal_in_{device_type}_legacy'
+        op.execute(f"""
+            ALTER TABLE journal DETACH PARTITION "journal_in_{device_type}";
+            ALTER TABLE "journal_in_{device_type}" RENAME TO "{legacy}";
+            CREATE TABLE "journal_in_{device_type}" PARTITION OF journal
+                FOR VALUES IN ('{device_type}') PARTITION BY RANGE (created);
+            ALTER TABLE "journal_in_{device_type}" ATTACH PARTITION "{legacy}"
+                FOR VALUES FROM (MINVALUE) TO ('{next_month}');
+            CREATE TABLE "journal_in_{device_type}_default"
+                PARTITION OF "journal_in_{device_type}" DEFAULT;
+        """)
+
+        for months in range(3):
+            month = month_start(next_month, months)
+            op.execute(f"""
+                CREATE TABLE IF NOT EXISTS "journal_in_{device_type}_y{month:%Y}m{month:%m}"
+                    PARTITION OF "journal_in_{device_type}"
+                    FOR VALUES FROM ('{month}') TO ('{month_start(month, 1)}');
+            """)
+
+
+def downgrade():
+    for device_type in DEVICE_TYPES:
+        op.execute(f"""
+            ALTER TABLE journal DETACH PARTITION "journal_in_{device_type}";
+            ALTER TABLE "journal_in_{device_type}" RENAME TO "journal_in_{device_type}_ranged";
+            CREATE TABLE "journal_in_{device_type}" (LIKE "journal_in_{device_type}_ranged");
+            INSERT INTO "journal_in_{device_type}" SELECT * FROM "journal_in_{device_type}_ranged";
+            DROP TABLE "journal_in_{device_type}_ranged";
+        """)
+
+    op.execute("""
+        ALTER TABLE journal DROP CONSTRAINT journal_pkey;
+        ALTER TABLE journal ADD PRIMARY KEY (id, _device_type);
+        ALTER TABLE journal ADD CONSTRAINT journal_id__device_type_key UNIQUE (id, _device_type);
+    """)
+
+    for device_type in DEVICE_TYPES:
+        op.execute(f"""
+            ALTER TABLE journal ATTACH PARTITION "journal_in_{device_type}"
+                FOR VALUES IN ('{device_type}');
+        """)
@@ -0,0 +1,36 @@
+"""roles_users_unique
+
+Revision ID: 9e4d0c2a7b13
+Revises: 2b9c1e7d4a60
+Create Date: 2026-10-18 19:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9e4d0c2a7b13'
+down_revision = '2b9c1e7d4a60'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Повторные связи пользователя с ролью удаляются перед созданием
+    # ограничения, остается одна
+    op.execute("""
+        DELETE FROM auth.roles_users duplicate
+        USING auth.roles_users original
+        WHERE duplicate.user_id = original.user_id
+          AND duplicate.role_id = original.role_id
+          AND duplicate.id > original.id;
+    """)
+    op.create_unique_constraint('uq_roles_users_user_id_role_id',
+                                'roles_users', ['user_id', 'role_id'],
+                                schema='auth')
+
+
+def downgrade():
+    op.drop_constraint('uq_roles_users_user_id_role_id', 'roles_users',
+                       type_='unique', schema='auth')
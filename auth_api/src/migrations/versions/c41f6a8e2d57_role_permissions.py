@@ -0,0 +1,28 @@
+"""role_permissions
+
+Revision ID: c41f6a8e2d57
+Revises: 9e4d0c2a7b13
+Create Date: 2026-10-18 21:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'c41f6a8e2d57'
+down_revision = '9e4d0c2a7b13'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('roles', sa.Column('permissions',
+                                     postgresql.ARRAY(sa.String(length=100)),
+                                     server_default='{}', nullable=False),
+                  schema='auth')
+
+
+def downgrade():
+    op.drop_column('roles', 'permissions', schema='auth')
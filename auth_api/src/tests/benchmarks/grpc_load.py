@@ -0,0 +1,102 @@
+"""Нагрузочный тест gRPC сервиса пользователей в двух режимах.
+
+Для каждого режима (`thread` - grpc.server с пулом потоков, `aio` -
+grpc.aio) запускается сервер, затем `--concurrency` корутин клиента
+вызывают `GetInfo` и считаются запросы в секунду и задержки.
+Без `--user-id` запрашиваются случайные id, то есть каждый вызов
+доходит до БД.
+
+Запуск (нужны Postgres и Redis из конфига приложения):
+    python -m tests.benchmarks.grpc_load --requests 20000 --concurrency 200
+"""
+import argparse
+import asyncio
+import os
+import random
+import subprocess
+import sys
+import time
+import uuid
+from collections import Counter
+
+import grpc
+
+GRPC_DIR = os.path.join(os.path.dirname(__file__), '..', '..', 'grpc')
+sys.path.append(GRPC_DIR)
+
+import messages.user_pb2 as user_messages  # noqa: E402
+import messages.user_pb2_grpc as user_service  # noqa: E402
+
+
+async def load(target, user_ids, requests, concurrency):
+    latencies = []
+    codes = Counter()
+    counter = iter(range(requests))
+
+    async with grpc.aio.insecure_channel(target) as channel:
+        stub = user_service.UserStub(channel)
+
+        async def worker():
+            for _ in counter:
+                request = user_messages.UserInfoRequest(
+                    id=random.choice(user_ids))
+                started = time.perf_counter()
+                try:
+                    await stub.GetInfo(request)
+                    codes[grpc.StatusCode.OK.name] += 1
+                except grpc.aio.AioRpcError as error:
+                    codes[error.code().name] += 1
+                latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        'rps': requests / elapsed,
+        'p50': latencies[len(latencies) // 2] * 1000,
+        'p99': latencies[int(len(latencies) * 0.99)] * 1000,
+        'codes': dict(codes),
+    }
+
+
+def start_server(mode, port, processes):
+    env = dict(os.environ, GRPC_PORT=str(port))
+    server = subprocess.Popen(
+        [sys.executable, os.path.join(GRPC_DIR, 'server.py'),
+         '--mode', mode, '--processes', str(processes)],
+        env=env)
+    channel = grpc.insecure_channel(f'localhost:{port}')
+    grpc.channel_ready_future(channel).result(timeout=30)
+    channel.close()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--modes', nargs='+', default=['thread', 'aio'])
+    parser.add_argument('--port', type=int, default=50061)
+    parser.add_argument('--processes', type=int, default=1)
+    parser.add_argument('--requests', type=int, default=20000)
+    parser.add_argument('--concurrency', type=int, default=200)
+    parser.add_argument('--user-id', action='append', dest='user_ids')
+    args = parser.parse_args()
+
+    user_ids = args.user_ids or [str(uuid.uuid4()) for _ in range(1000)]
+
+    for mode in args.modes:
+        server = start_server(mode, args.port, args.processes)
+        try:
+            result = asyncio.run(load(f'localhost:{args.port}', user_ids,
+                                      args.requests, args.concurrency))
+        finally:
+            server.terminate()
+            server.wait()
+        print(f'{mode:>6}: {result["rps"]:8.0f} rps, '
+              f'p50 {result["p50"]:7.2f} ms, p99 {result["p99"]:7.2f} ms, '
+              f'{result["codes"]}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+"""Нагрузочное сравнение реализаций Token bucket для RateLimiter.
+
+`legacy` - прежняя схема: GET + разбор JSON + SET (два обращения к Redis,
+без атомарности), `script` - атомарный Lua-скрипт из `app.core.middleware`.
+
+Запуск:
+    python -m tests.benchmarks.rate_limiter --workers 8 --duration 5
+"""
+import argparse
+import os
+import threading
+import time
+
+import orjson
+import redis
+from app.core.middleware import TOKEN_BUCKET_SCRIPT
+
+CAPACITY = 10
+REFILL_PERIOD = 0.1
+
+
+def legacy_consume(client, key):
+    current_bucket = client.get(key)
+    if current_bucket:
+        bucket = orjson.loads(current_bucket)
+    else:
+        bucket = {'capacity': CAPACITY, 'last_check': time.monotonic()}
+
+    now = time.monotonic()
+    refill = int((now - bucket['last_check']) // REFILL_PERIOD)
+    capacity = min(CAPACITY, bucket['capacity'] + refill)
+    allowed = capacity >= 1
+    if allowed:
+        capacity -= 1
+    client.set(key, orjson.dumps({'capacity': capacity, 'last_check': now}))
+    return allowed
+
+
+def script_consume(client, key, script):
+    allowed, _ = script(keys=[key], args=[CAPACITY, REFILL_PERIOD * 1000])
+    return bool(allowed)
+
+
+def run(mode, client, workers, duration):
+    script = client.register_script(TOKEN_BUCKET_SCRIPT)
+    counters = [0] * workers
+    key = f'benchmark:rate_limit:{mode}'
+    client.delete(key)
+    deadline = time.monotonic() + duration
+
+    def worker(index):
+        while time.monotonic() < deadline:
+            if mode == 'legacy':
+                legacy_consume(client, key)
+            else:
+                script_consume(client, key, script)
+            counters[index] += 1
+
+    threads = [threading.Thread(target=worker, args=(index,))
+               for index in range(workers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    client.delete(key)
+    total = sum(counters)
+    return total / duration, total / duration / workers
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--url', default=os.getenv(
+        'REDIS_URL', 'redis://127.0.0.1:6379/0'))
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=5)
+    args = parser.parse_args()
+
+    client = redis.Redis.from_url(args.url,
+                                  max_connections=args.workers * 2)
+    for mode in ('legacy', 'script'):
+        total, per_worker = run(mode, client, args.workers, args.duration)
+        print(f'{mode:>8}: {total:10.1f} req/s total, '
+              f'{per_worker:10.1f} req/s per worker')
+
+
+if __name__ == '__main__':
+    main()
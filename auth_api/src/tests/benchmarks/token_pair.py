@@ -0,0 +1,67 @@
+"""Пропускная способность выдачи пары токенов.
+
+Сравнивается прежняя схема (refresh токен декодируется ради sub и jti,
+затем еще раз ради `rti`) и выдача с заранее созданным jti, где пара
+токенов стоит ровно двух подписей. Запись сеанса в Redis не
+учитывается, чтобы измерялась только работа с JWT.
+
+Запуск:
+    python -m tests.benchmarks.token_pair --pairs 5000
+"""
+import argparse
+import time
+import uuid
+
+from app import create_app
+from app.core.config import TestingConfig
+from app.models.user import Profile, User, issue_token_pair
+from flask_jwt_extended import (create_access_token, create_refresh_token,
+                                decode_token, get_jti)
+
+
+def decoded_pair(user):
+    """Прежняя схема: два лишних декодирования refresh токена"""
+    refresh_token = create_refresh_token(identity=user)
+    decode_token(refresh_token)
+    access_token = create_access_token(
+        identity=user,
+        additional_claims={
+            'name': user.full_name,
+            'rti': get_jti(refresh_token)
+        }
+    )
+    return access_token, refresh_token
+
+
+def upfront_pair(user):
+    """Текущая схема: jti создается до подписи"""
+    return issue_token_pair(user, user.full_name, str(uuid.uuid4()))
+
+
+def measure(issue, user, pairs):
+    started = time.perf_counter()
+    for _ in range(pairs):
+        issue(user)
+    return pairs / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--pairs', type=int, default=5000)
+    args = parser.parse_args()
+
+    app = create_app(TestingConfig)
+    user = User(id=uuid.uuid4(), email='benchmark@example.com',
+                is_superuser=False)
+    user.profile = Profile(first_name='bench', last_name='mark')
+
+    with app.test_request_context():
+        decoded = measure(decoded_pair, user, args.pairs)
+        upfront = measure(upfront_pair, user, args.pairs)
+
+    print(f'decode refresh token: {decoded:10.0f} pairs/s')
+    print(f'jti up front:         {upfront:10.0f} pairs/s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+"""Стоимость определения типа устройства на одно событие журнала.
+
+Сравнивается разбор `user_agents.parse` на каждое событие и
+кешированный `get_device_type` на выборке, где немногие популярные
+User-Agent встречаются гораздо чаще остальных (распределение Ципфа).
+
+Запуск:
+    python -m tests.benchmarks.user_agents --events 50000
+"""
+import argparse
+import random
+import time
+
+from app.models.journal import get_device_type
+
+USER_AGENTS = [
+    'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 '
+    '(KHTML, like Gecko) Chrome/100.0.4896.127 Safari/537.36',
+    'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 '
+    '(KHTML, like Gecko) Version/15.4 Safari/605.1.15',
+    'Mozilla/5.0 (iPhone; CPU iPhone OS 15_4 like Mac OS X) '
+    'AppleWebKit/605.1.15 (KHTML, like Gecko) Version/15.4 '
+    'Mobile/15E148 Safari/604.1',
+    'Mozilla/5.0 (Linux; Android 12; SM-G991B) AppleWebKit/537.36 '
+    '(KHTML, like Gecko) Chrome/100.0.4896.127 Mobile Safari/537.36',
+    'Mozilla/5.0 (X11; Linux x86_64; rv:99.0) Gecko/20100101 Firefox/99.0',
+    'Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:99.0) Gecko/20100101 '
+    'Firefox/99.0',
+    'Mozilla/5.0 (iPad; CPU OS 15_4 like Mac OS X) AppleWebKit/605.1.15 '
+    '(KHTML, like Gecko) Version/15.4 Mobile/15E148 Safari/604.1',
+    'Mozilla/5.0 (SMART-TV; Linux; Tizen 6.0) AppleWebKit/538.1 '
+    '(KHTML, like Gecko) Version/6.0 TV Safari/538.1',
+    'Mozilla/5.0 (Web0S; Linux/SmartTV) AppleWebKit/537.36 '
+    '(KHTML, like Gecko) Chrome/79.0.3945.79 Safari/537.36 WebAppManager',
+    'Mozilla/5.0 (Linux; Android 9; SHIELD Android TV) AppleWebKit/537.36 '
+    '(KHTML, like Gecko) Chrome/99.0.4844.88 Safari/537.36',
+    'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 '
+    '(KHTML, like Gecko) Chrome/100.0.4896.127 Safari/537.36 '
+    'Edg/100.0.1185.50',
+    'Mozilla/5.0 (Linux; Android 11; Redmi Note 8 Pro) AppleWebKit/537.36 '
+    '(KHTML, like Gecko) Chrome/99.0.4844.88 Mobile Safari/537.36',
+    'python-requests/2.27.1',
+    'PostmanRuntime/7.29.0',
+]
+
+
+def corpus(events, distinct):
+    """Выборка User-Agent: популярные строки плюс редкие уникальные"""
+    user_agents = USER_AGENTS + [
+        f'{random.choice(USER_AGENTS)} build/{index}'
+        for index in range(distinct - len(USER_AGENTS))
+    ]
+    weights = [1 / rank for rank in range(1, len(user_agents) + 1)]
+    return random.choices(user_agents, weights=weights, k=events)
+
+
+def measure(classify, user_agents):
+    started = time.perf_counter()
+    for user_agent in user_agents:
+        classify(user_agent)
+    return (time.perf_counter() - started) / len(user_agents) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--events', type=int, default=50000)
+    parser.add_argument('--distinct', type=int, default=500)
+    args = parser.parse_args()
+
+    user_agents = corpus(args.events, args.distinct)
+
+    uncached = measure(get_device_type.__wrapped__, user_agents)
+    get_device_type.cache_clear()
+    cached = measure(get_device_type, user_agents)
+
+    print(f'parse per event:  {uncached:8.2f} us')
+    print(f'cached per event: {cached:8.2f} us')
+    print(get_device_type.cache_info())
+
+
+if __name__ == '__main__':
+    main()
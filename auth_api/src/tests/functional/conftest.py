@@ -3,6 +3,7 @@ import uuid
 import pytest
 from app import create_app
 from app.core.config import TestingConfig
+from sqlalchemy import event
 
 
 @pytest.fixture(scope='session')
@@ -32,6 +33,19 @@ def cache(app):
         cache.close()
 
 
+@pytest.fixture
+def queries(db):
+    """Список SQL-запросов, выполненных во время теста"""
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+    yield statements
+    event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+
+
 @pytest.fixture(scope='session')
 def client(app):
     client = app.test_client()
@@ -1,4 +1,5 @@
 import pytest
+from app import email_filter, user_cache
 from app.models.user import User
 from flask_jwt_extended import decode_token
 from tests.functional.testdata.factories import (ChangeEmailFactory,
@@ -94,7 +95,7 @@ class TestAccount(object):
         for i in range(3):
             client.post('/api/v1/auth/login/', json=user)
         user_id = User.find_by_email(user['email']).id
-        sessions_before = cache.keys(f'user:{user_id}:*')
+        sessions_before = cache.hkeys(f'sessions:{user_id}')
         data = ChangePasswordFactory(current_password=user['password'])
         response = client.post(
             '/api/v1/account/change-password/',
@@ -102,7 +103,7 @@ class TestAccount(object):
             json=data)
         assert response.status_code == 200, \
             'Проверьте, что при запросе возвращается статус 200'
-        sessions_after = cache.keys(f'user:{user_id}:*')
+        sessions_after = cache.hkeys(f'sessions:{user_id}')
         assert len(sessions_before) != len(sessions_after)
         assert len(sessions_after) == 1, \
             'Проверьте, что осталась только одна активная сессия'
@@ -122,7 +123,7 @@ class TestAccount(object):
         for i in range(3):
             client.post('/api/v1/auth/login/', json=user)
         user_id = User.find_by_email(user['email']).id
-        sessions_before = cache.keys(f'user:{user_id}:*')
+        sessions_before = cache.hkeys(f'sessions:{user_id}')
         data = ChangeEmailFactory(current_email=user['email'])
         response = client.post(
             '/api/v1/account/change-email/',
@@ -130,7 +131,7 @@ class TestAccount(object):
             json=data)
         assert response.status_code == 200, \
             'Проверьте, что при запросе возвращается статус 200'
-        sessions_after = cache.keys(f'user:{user_id}:*')
+        sessions_after = cache.hkeys(f'sessions:{user_id}')
         assert len(sessions_before) != len(sessions_after)
         assert len(sessions_after) == 1, \
             'Проверьте, что осталась только одна активная сессия(текущая)'
@@ -242,3 +243,89 @@ class TestAccount(object):
         )
         assert len(response.json) == 1, \
             'Проверьте, что осталась только одна активная сессия'
+
+    @pytest.mark.dependency(depends=['TestAccount::test_06_change_email'])
+    def test_11_journal_pagination(self, client, db, cache):
+        access_token = pytest.shared['access_token']
+        headers = {'Authorization': f'Bearer {access_token}'}
+        response = client.get('/api/v1/account/journal/',
+                              headers=headers, query_string={'limit': 2})
+        assert response.status_code == 200, \
+            'Проверьте, что при запросе возвращается статус 200'
+        assert len(response.json) == 2, \
+            'Проверьте, что количество событий ограничено `limit`'
+        cursor = response.headers.get('X-Next-Cursor')
+        assert cursor, \
+            'Проверьте, что возвращается курсор следующей страницы'
+
+        first_page = [event['id'] for event in response.json]
+        response = client.get('/api/v1/account/journal/', headers=headers,
+                              query_string={'limit': 2, 'cursor': cursor})
+        assert response.status_code == 200, \
+            'Проверьте, что при запросе возвращается статус 200'
+        assert not {event['id'] for event in response.json} & \
+            set(first_page), 'Проверьте, что страницы не пересекаются'
+
+        response = client.get('/api/v1/account/journal/', headers=headers,
+                              query_string={'cursor': 'invalid'})
+        assert response.status_code == 422, \
+            'Проверьте, что некорректный курсор возвращает статус 422'
+
+    @pytest.mark.dependency(depends=['TestAccount::test_03_profile_edit'])
+    def test_12_account_cache(self, client, db, cache, queries):
+        access_token = pytest.shared['access_token']
+        headers = {'Authorization': f'Bearer {access_token}'}
+        response = client.get('/api/v1/account/', headers=headers)
+        assert response.status_code == 200, \
+            'Проверьте, что при запросе возвращается статус 200'
+
+        queries.clear()
+        response = client.get('/api/v1/account/', headers=headers)
+        assert not queries, \
+            'Повторный запрос аккаунта не должен обращаться к БД'
+
+        response = client.patch('/api/v1/account/', headers=headers,
+                                json={'first_name': 'Cached'})
+        assert response.status_code == 200, \
+            'Проверьте, что при запросе возвращается статус 200'
+        response = client.get('/api/v1/account/', headers=headers)
+        assert response.json['full_name'].startswith('Cached'), \
+            'После изменения профиля кеш должен сбрасываться'
+
+    @pytest.mark.dependency(depends=['TestAccount::test_03_profile_edit'])
+    def test_13_user_changes_feed(self, client, db, cache):
+        access_token = pytest.shared['access_token']
+        user_id = decode_token(access_token)['sub']
+        version = user_cache.last_version()
+
+        response = client.patch(
+            '/api/v1/account/',
+            headers={'Authorization': f'Bearer {access_token}'},
+            json={'last_name': 'Watched'})
+        assert response.status_code == 200, \
+            'Проверьте, что при запросе возвращается статус 200'
+
+        changes = user_cache.read_changes(version)
+        assert user_id in [id for _, id in changes], \
+            'Изменение профиля должно попадать в ленту изменений'
+
+    @pytest.mark.dependency(depends=['TestAccount::test_01_register_user'])
+    def test_14_register_with_email_filter(self, client, db, cache, queries):
+        email_filter.build(email for email, in db.session.query(User.email))
+        assert email_filter.might_contain(pytest.shared['user']['email']), \
+            'Зарегистрированный email должен попадать в фильтр'
+
+        new_user = RegisterUserFactory()
+        queries.clear()
+        response = client.post('/api/v1/account/register/', json=new_user)
+        assert response.status_code == 201, \
+            'Проверьте, что при запросе возвращается статус 201'
+        assert not [query for query in queries if 'EXISTS' in query], \
+            'Новый email не должен проверяться отдельным запросом к БД'
+        assert email_filter.might_contain(new_user['email']), \
+            'После регистрации email должен попадать в фильтр'
+
+        response = client.post('/api/v1/account/register/', json=new_user)
+        assert response.status_code == 422, \
+            'Проверьте, что при запросе возвращается статус 422' \
+            'Невозможно зарегистрироваться с повторяющимся email'
@@ -1,7 +1,11 @@
 import pytest
+from app import user_cache
+from app.models.user import TOTPDevice
+from app.db.redis import KeyspaceCommandError
 from flask_jwt_extended import decode_token
 from freezegun import freeze_time
-from tests.functional.testdata.factories import UserFactory
+from tests.functional.testdata.factories import RoleFactory, UserFactory
+from werkzeug.security import generate_password_hash
 
 
 class TestAuth(object):
@@ -106,7 +110,7 @@ class TestAuth(object):
             'Проверьте, что при запросе возвращается статус 200'
         user_id = decode_token(access_token)['sub']
         rti = decode_token(access_token)['rti']
-        cache.delete(f'user:{user_id}:{rti}')
+        cache.hdel(f'sessions:{user_id}', rti)
         response = client.get(
             '/api/v1/account/journal/',
             headers={'Authorization': f'Bearer {access_token}'})
@@ -132,3 +136,155 @@ class TestAuth(object):
             'Проверьте, что при запросе возвращается статус 401'
         assert response.json['msg'] == 'Token has expired', \
             'В ответе есть сообщение об истечении срока действия токена'
+
+    def test_10_keyspace_commands_forbidden(self, app, cache):
+        with app.test_request_context('/api/v1/auth/logout/'):
+            with pytest.raises(KeyspaceCommandError):
+                cache.keys()
+            with pytest.raises(KeyspaceCommandError):
+                list(cache.scan_iter('user:*'))
+
+    def test_11_login_hasher_saturated(self, app, client, db):
+        hasher = app.extensions['password_hasher']
+        pool, queue_size = hasher.pool, hasher.queue_size
+        hasher.pool, hasher.queue_size, hasher._pid = True, 0, None
+        try:
+            response = client.post('/api/v1/auth/login/',
+                                    json=pytest.shared['user'])
+        finally:
+            hasher.pool, hasher.queue_size, hasher._pid = \
+                pool, queue_size, None
+        assert response.status_code == 503, \
+            'Проверьте, что при перегрузке пула возвращается статус 503'
+        assert 'Retry-After' in response.headers, \
+            'В ответе должен быть заголовок `Retry-After`'
+
+    def test_12_password_rehash_on_login(self, app, client, db):
+        hasher = app.extensions['password_hasher']
+        user = UserFactory()
+        user.password = generate_password_hash(
+            'password', method='pbkdf2:sha256:1000')
+        db.session.commit()
+
+        response = client.post('/api/v1/auth/login/', json={
+            'email': user.email,
+            'password': 'password'
+        })
+        assert response.status_code == 200, \
+            'Проверьте, что при запросе возвращается статус 200'
+        assert user.password.startswith(f'{hasher.policy}$'), \
+            'Проверьте, что хеш пароля обновлен по текущей политике'
+
+    def test_13_login_query_count(self, client, db, queries):
+        user = UserFactory()
+        db.session.commit()
+        queries.clear()
+
+        response = client.post('/api/v1/auth/login/', json={
+            'email': user.email,
+            'password': 'password'
+        })
+        assert response.status_code == 200, \
+            'Проверьте, что при запросе возвращается статус 200'
+        selects = [query for query in queries
+                   if query.lstrip().upper().startswith('SELECT')]
+        assert len(selects) <= 2, \
+            'Пользователь, профиль, TOTP и роли загружаются двумя запросами'
+
+    def test_14_token_refresh_rotation(self, client, db, queries):
+        user = UserFactory()
+        response = client.post('/api/v1/auth/login/', json={
+            'email': user.email,
+            'password': 'password'
+        })
+        refresh_token = response.json['refresh_token']
+        user_cache.get(user.id)
+        queries.clear()
+
+        response = client.post(
+            '/api/v1/auth/token/refresh/',
+            json={'refresh_token': refresh_token})
+        assert response.status_code == 200, \
+            'Проверьте, что при запросе возвращается статус 200'
+        assert not queries, \
+            'Обновление пары токенов с пользователем в кеше ' \
+            'не должно обращаться к БД'
+
+        response = client.post(
+            '/api/v1/auth/token/refresh/',
+            json={'refresh_token': refresh_token})
+        assert response.status_code == 403, \
+            'Повторное обновление старым refresh токеном возвращает 403'
+
+    def test_15_token_refresh_reloads_roles(self, client, db):
+        user = UserFactory()
+        role = RoleFactory()
+        db.session.commit()
+        user.add_roles([role.id])
+        response = client.post('/api/v1/auth/login/', json={
+            'email': user.email,
+            'password': 'password'
+        })
+        refresh_token = response.json['refresh_token']
+        assert role.name in decode_token(
+            response.json['access_token'])['roles'].split(','), \
+            'Проверьте, что роль попадает в токен при входе'
+
+        user.remove_roles([role.id])
+        response = client.post(
+            '/api/v1/auth/token/refresh/',
+            json={'refresh_token': refresh_token})
+        assert response.status_code == 200, \
+            'Проверьте, что при запросе возвращается статус 200'
+        claims = decode_token(response.json['access_token'])
+        assert role.name not in claims['roles'].split(','), \
+            'Отозванная роль не должна попадать в обновленный токен'
+
+        user.active = False
+        db.session.commit()
+        response = client.post(
+            '/api/v1/auth/token/refresh/',
+            json={'refresh_token': response.json['refresh_token']})
+        assert response.status_code == 403, \
+            'Неактивный пользователь не может обновить пару токенов'
+
+    def test_16_expired_sessions_pruned(self, client, db, cache):
+        user = UserFactory()
+        credentials = {'email': user.email, 'password': 'password'}
+        response = client.post('/api/v1/auth/login/', json=credentials)
+        access_token = response.json['access_token']
+        user_id = decode_token(access_token)['sub']
+        rti = decode_token(access_token)['rti']
+
+        # Сеанс истек, а hash с сеансами еще жив
+        cache.zadd(f'sessions:{user_id}:expires', {rti: 1})
+        response = client.get(
+            '/api/v1/account/',
+            headers={'Authorization': f'Bearer {access_token}'})
+        assert response.status_code == 403, \
+            'Проверьте, что токен истекшего сеанса не принимается'
+
+        client.post('/api/v1/auth/login/', json=credentials)
+        assert not cache.hexists(f'sessions:{user_id}', rti), \
+            'Истекшие сеансы должны удаляться при входе'
+        assert cache.zscore(f'sessions:{user_id}:expires', rti) is None, \
+            'Истекшие сеансы должны удаляться из sorted set'
+
+    def test_17_password_rehash_on_totp_login(self, app, client, db):
+        hasher = app.extensions['password_hasher']
+        user = UserFactory()
+        user.password = generate_password_hash(
+            'password', method='pbkdf2:sha256:1000')
+        db.session.add(TOTPDevice(user=user, key='base32secret3232',
+                                  confirmed=True))
+        db.session.commit()
+
+        response = client.post('/api/v1/auth/login/', json={
+            'email': user.email,
+            'password': 'password'
+        })
+        assert response.status_code == 302, \
+            'Проверьте, что пользователь с 2FA перенаправляется на проверку'
+        db.session.rollback()
+        assert user.password.startswith(f'{hasher.policy}$'), \
+            'Проверьте, что обновленный хеш сохранен и при входе с 2FA'
@@ -1,4 +1,9 @@
+from datetime import date, datetime
+
+from app.models.journal import (Action, Journal, create_month_partitions,
+                                month_start, partition_name)
 from app.models.user import User
+from tests.functional.testdata.factories import UserFactory
 
 
 def test_01_create_superuser(runner, db):
@@ -15,3 +20,66 @@ def test_01_create_superuser(runner, db):
     user = User.find_by_email(email)
     assert user.is_superuser is True, \
         'Проверьте, что у пользователя установлен флаг `is_superuser`'
+
+
+def test_02_journal_partitions(runner, db):
+    expired_month = month_start(date.today(), -24)
+    next_month = month_start(date.today(), 1)
+    with db.engine.begin() as connection:
+        create_month_partitions(connection, expired_month)
+
+    result = runner.invoke(args=['journal', 'partitions',
+                                 '--ahead', '1', '--retention', '12'])
+    assert result.exit_code == 0, \
+        'Проверьте, что exit_code консольной команды 0'
+    assert f'Partition <{partition_name("web", next_month)}> is ready' \
+        in result.output, 'Проверьте, что создаются будущие секции'
+    assert f'Partition <{partition_name("web", expired_month)}> dropped' \
+        in result.output, 'Проверьте, что устаревшие секции удаляются'
+
+
+def test_03_journal_partitions_from_default(runner, db):
+    user = UserFactory()
+    db.session.commit()
+    month = month_start(date.today(), 6)
+    with db.engine.begin() as connection:
+        # Секции этого месяца еще нет, событие попадает в DEFAULT
+        connection.execute(Journal.__table__.insert().values(
+            user_id=user.id, action=Action.login, _device_type='web',
+            created=datetime(month.year, month.month, 15)))
+
+    result = runner.invoke(args=['journal', 'partitions', '--ahead', '6'])
+    assert result.exit_code == 0, \
+        'Проверьте, что exit_code консольной команды 0'
+
+    name = partition_name('web', month)
+    with db.engine.begin() as connection:
+        moved = connection.execute(f'SELECT count(*) FROM "{name}"').scalar()
+        left = connection.execute(
+            'SELECT count(*) FROM "journal_in_web_default"').scalar()
+    assert moved == 1 and left == 0, \
+        'События из секции DEFAULT должны переноситься в новую секцию'
+
+
+def test_04_journal_partitions_legacy(runner, db):
+    end = month_start(date.today(), -24)
+    with db.engine.begin() as connection:
+        connection.execute(
+            'CREATE TABLE "journal_in_web_legacy" PARTITION OF '
+            f'"journal_in_web" FOR VALUES FROM (MINVALUE) TO (\'{end}\')')
+
+    result = runner.invoke(args=['journal', 'partitions',
+                                 '--ahead', '1', '--retention', '12'])
+    assert result.exit_code == 0, \
+        'Проверьте, что exit_code консольной команды 0'
+    assert 'Partition <journal_in_web_legacy> dropped' in result.output, \
+        'Секция legacy удаляется, когда ее верхняя граница устарела'
+
+
+def test_05_password_calibrate(runner):
+    result = runner.invoke(args=['password', 'calibrate',
+                                 '--target-ms', '10'])
+    assert result.exit_code == 0, \
+        'Проверьте, что exit_code консольной команды 0'
+    assert result.output.startswith('PASSWORD_HASHER_ITERATIONS='), \
+        'Проверьте, что выводится подобранное число итераций'
@@ -0,0 +1,99 @@
+import os
+import sys
+import threading
+from concurrent import futures
+
+import grpc
+import pytest
+from app import user_cache
+from app.core.user_cache import parse_version
+from tests.functional.testdata.factories import UserFactory
+
+GRPC_DIR = os.path.join(os.path.dirname(__file__), '..', '..', '..', 'grpc')
+sys.path.append(GRPC_DIR)
+
+import messages.user_pb2 as user_messages  # noqa: E402
+import messages.user_pb2_grpc as user_service  # noqa: E402
+from services.user import UserService  # noqa: E402
+
+
+@pytest.fixture(scope='module')
+def grpc_service(app, db, cache):
+    service = UserService(app)
+    server = grpc.server(futures.ThreadPoolExecutor(max_workers=4))
+    user_service.add_UserServicer_to_server(service, server)
+    port = server.add_insecure_port('localhost:0')
+    server.start()
+    with grpc.insecure_channel(f'localhost:{port}') as channel:
+        yield service, user_service.UserStub(channel)
+    server.stop(None)
+
+
+def first_change(stub, version):
+    call = stub.WatchUsers(
+        user_messages.WatchUsersRequest(version=version), timeout=10)
+    try:
+        return next(call)
+    finally:
+        call.cancel()
+
+
+class TestGrpc(object):
+    def test_01_watch_resume_from_version(self, grpc_service, db):
+        _, stub = grpc_service
+        version = user_cache.last_version()
+
+        user = UserFactory()
+        db.session.commit()
+
+        change = first_change(stub, version)
+        assert change.id == str(user.id), \
+            'Подписчик должен получить изменение после переданной версии'
+        assert change.active and not change.reset, \
+            'Изменение должно содержать состояние пользователя'
+        assert parse_version(change.version) > parse_version(version), \
+            'Версия изменения должна быть больше переданной'
+
+    def test_02_watch_reset_on_trimmed_stream(self, grpc_service, db, cache):
+        _, stub = grpc_service
+        UserFactory()
+        db.session.commit()
+        version = user_cache.last_version()
+
+        UserFactory.create_batch(3)
+        db.session.commit()
+        cache.xtrim(user_cache.stream, maxlen=1, approximate=False)
+
+        change = first_change(stub, version)
+        assert change.reset, \
+            'Если лента обрезана после версии подписчика, первым ' \
+            'приходит сброс'
+
+    def test_03_watch_no_reset_if_only_own_version_trimmed(
+            self, grpc_service, db, cache):
+        _, stub = grpc_service
+        UserFactory()
+        db.session.commit()
+        version = user_cache.last_version()
+
+        user = UserFactory()
+        db.session.commit()
+        cache.xtrim(user_cache.stream, maxlen=1, approximate=False)
+
+        change = first_change(stub, version)
+        assert not change.reset and change.id == str(user.id), \
+            'Если обрезана только запись подписчика, сброс не нужен'
+
+    def test_04_watch_max_streams(self, grpc_service):
+        service, stub = grpc_service
+        slots = service.watch_slots
+        service.watch_slots = threading.BoundedSemaphore(1)
+        service.watch_slots.acquire()
+        try:
+            with pytest.raises(grpc.RpcError) as error:
+                first_change(stub, '')
+        finally:
+            service.watch_slots = slots
+        assert error.value.code() == grpc.StatusCode.RESOURCE_EXHAUSTED, \
+            'Подписчики сверх GRPC_WATCH_MAX_STREAMS получают ' \
+            'RESOURCE_EXHAUSTED'
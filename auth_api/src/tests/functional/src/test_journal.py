@@ -0,0 +1,33 @@
+from app import journal_sink
+from app.models.journal import Action, Journal
+from flask import request
+from tests.functional.testdata.factories import UserFactory
+
+
+class TestJournalSink(object):
+    def test_01_journal_sink_writes_batches(self, app, db):
+        user = UserFactory()
+        db.session.commit()
+
+        config = {'JOURNAL_SINK_ENABLED': True,
+                  'JOURNAL_SINK_FLUSH_INTERVAL': 0.1}
+        saved = {key: app.config[key] for key in config}
+        app.config.update(config)
+        journal_sink.init_app(app)
+        written = journal_sink.stats['written']
+        dropped = journal_sink.stats['dropped']
+        try:
+            with app.test_request_context(headers={'User-Agent': 'pytest'}):
+                for _ in range(3):
+                    Journal.write(Action.login, request, user.id)
+            journal_sink.shutdown()
+        finally:
+            app.config.update(saved)
+            journal_sink.init_app(app)
+
+        assert journal_sink.stats['written'] - written == 3, \
+            'Проверьте, что все события из очереди записаны'
+        assert journal_sink.stats['dropped'] == dropped, \
+            'Проверьте, что события не отброшены'
+        assert Journal.query.filter_by(user_id=user.id).count() == 3, \
+            'Проверьте, что события сохранены в журнал'
@@ -1,9 +1,13 @@
+import json
 import uuid
 from http import HTTPStatus
 
 import pytest
+from app import permissions
+from app.core.decorators import roles_required
 from app.models.rbac import Role, RolesUsers
 from app.models.user import Journal, Profile, User
+from flask_jwt_extended import decode_token
 from tests.functional.testdata.factories import RoleFactory, UserFactory
 
 
@@ -230,6 +234,50 @@ class TestRBACUsers(General):
         assert 'User not found' == response.json.get('msg')
         assert response.status_code == HTTPStatus.NOT_FOUND
 
+    def test_11_users_pagination(self, client, db, su_headers):
+
+        num = 10
+        UserFactory.create_batch(num)
+
+        response = client.get(self.base_url, headers=su_headers,
+                              query_string={'limit': 4})
+        assert len(response.json) == 4
+        cursor = response.headers.get('X-Next-Cursor')
+        assert cursor, 'Проверьте, что возвращается курсор следующей страницы'
+
+        seen = [user['id'] for user in response.json]
+        while cursor:
+            response = client.get(self.base_url, headers=su_headers,
+                                  query_string={'limit': 4, 'cursor': cursor})
+            seen.extend(user['id'] for user in response.json)
+            cursor = response.headers.get('X-Next-Cursor')
+
+        # суперюзер уже создан, поэтому в базе будет на одного юзер больше
+        assert len(seen) == len(set(seen)) == num + 1
+
+        response = client.get(self.base_url, headers=su_headers,
+                              query_string={'format': 'ndjson'})
+        assert response.mimetype == 'application/x-ndjson'
+        lines = response.get_data(as_text=True).splitlines()
+        assert [json.loads(line)['id'] for line in lines] == sorted(seen)
+
+    def test_12_admin_role_permission(self, client, db, get_headers):
+
+        role = RoleFactory(name='admin')
+        user = UserFactory()
+        db.session.flush()
+        db.session.add(RolesUsers(user_id=user.id, role_id=role.id))
+        db.session.commit()
+
+        headers = get_headers(user)
+        claims = decode_token(headers['Authorization'].split()[-1])
+        assert claims['perms'] & permissions.mask('admin'), \
+            'Роль admin должна давать одноименное право в claim `perms`'
+        assert not claims['perms'] & permissions.mask('superuser')
+
+        response = client.get(self.base_url, headers=headers)
+        assert response.status_code == HTTPStatus.OK
+
 
 class TestRBACRoles(General):
 
@@ -496,3 +544,87 @@ class TestRBACRoles(General):
         role_from_db = Role.query.get(role.id)
 
         assert role_from_db is None
+
+    def test_15_bulk_role_assignment_affected(self, client, db, su_headers):
+
+        num = 10
+        role = RoleFactory()
+        users = UserFactory.create_batch(num)
+        db.session.flush()
+
+        body = {
+            'users': [user.id for user in users]
+        }
+
+        url = self.compile_url(role.id, 'users')
+
+        response = client.post(url, headers=su_headers, json=body)
+        assert response.json.get('affected') == num
+
+        response = client.post(url, headers=su_headers, json=body)
+        assert response.json.get('affected') == 0
+        assert RolesUsers.query.filter_by(role_id=role.id).count() == num
+
+        response = client.delete(url, headers=su_headers, json=body)
+        assert response.json.get('affected') == num
+        assert RolesUsers.query.filter_by(role_id=role.id).count() == 0
+
+    def test_16_role_permissions_from_api(self, client, db, su_headers,
+                                          get_headers):
+
+        body = {
+            'name': 'editor',
+            'permissions': ['admin']
+        }
+        response = client.post(self.base_url, headers=su_headers, json=body)
+        assert response.status_code == HTTPStatus.CREATED
+
+        role = Role.find_by_name('editor')
+        assert role.permissions == ['admin']
+
+        user = UserFactory()
+        db.session.commit()
+        role.add_to_users([user.id])
+
+        headers = get_headers(user)
+        claims = decode_token(headers['Authorization'].split()[-1])
+        assert claims['perms'] & permissions.mask('admin'), \
+            'Роль, созданная через API, должна давать свои права ' \
+            'без перезапуска'
+
+        response = client.get(self.base_url, headers=headers)
+        assert response.status_code == HTTPStatus.OK
+
+        body = {'name': 'broken', 'permissions': ['unknown']}
+        response = client.post(self.base_url, headers=su_headers, json=body)
+        assert response.status_code == HTTPStatus.UNPROCESSABLE_ENTITY, \
+            'Неизвестные права роли должны отклоняться'
+
+
+class TestRBACDecorators(object):
+
+    def test_01_roles_required_has_all(self, app, db, get_headers):
+        view = roles_required('admin')(lambda: 'ok')
+        config = (app.config['PERMISSIONS'], app.config['ROLE_PERMISSIONS'])
+        permissions.compile(['superuser', 'admin', 'editor'], {})
+        try:
+            admin = Role.find_by_name('admin') or RoleFactory(name='admin')
+            editor = RoleFactory(name='editor')
+            full, partial = UserFactory(), UserFactory()
+            db.session.flush()
+            db.session.add_all([
+                RolesUsers(user_id=full.id, role_id=admin.id),
+                RolesUsers(user_id=full.id, role_id=editor.id),
+                RolesUsers(user_id=partial.id, role_id=editor.id),
+            ])
+            db.session.commit()
+
+            with app.test_request_context(headers=get_headers(full)):
+                assert view() == 'ok', \
+                    'Пользователь с требуемым и дополнительным правом ' \
+                    'должен получать доступ'
+            with app.test_request_context(headers=get_headers(partial)):
+                assert view()[1] == HTTPStatus.FORBIDDEN, \
+                    'Без требуемого права доступ запрещен'
+        finally:
+            permissions.compile(*config)